@@ -0,0 +1,267 @@
+"""Several snakes on one board competing for several apples.
+
+    python arena.py --snakes 24 --apples 8 --games 10
+    python arena.py --snakes 6 --players 2 --render
+
+Every snake follows the rules of game_state.GameState. The board
+occupancy is shared by all snakes, so a collision with any of them is
+one lookup whatever number of snakes there is. Snakes whose heads meet
+in one cell die both, dead snakes leave the board.
+"""
+import argparse
+import time
+from math import ceil, sqrt
+from random import Random
+
+from bots import POLICIES
+from game_state import ATE, DIED, MOVED, Occupancy, SnakeState
+from the_snake import BOARD_HEIGHT, BOARD_WIDTH, DIFFICULTIES
+
+# Apples on the board at once:
+ARENA_APPLES = 3
+# Games longer than this are stopped:
+MAX_TICKS = 100_000
+
+
+class ArenaSnake(SnakeState):
+    """One snake of the arena.
+
+    It has the GameState attributes used by the game view and bots,
+    so they work with arena snakes unchanged.
+    """
+
+    def __init__(self, arena, start: int):
+        """Initialize the snake on the start cell."""
+        super().__init__(arena.width, arena.height)
+        self.arena = arena
+        self.start = start
+        self.won = False
+        self.lost = False
+        self._place_snake(start)
+
+    @property
+    def ticks(self) -> int:
+        """Return the number of ticks played in the arena."""
+        return self.arena.ticks
+
+    @property
+    def apple(self):
+        """Return the nearest apple, None if there are no apples."""
+        apples = self.arena.apples
+        if not apples:
+            return None
+        head_x, head_y = self.coordinates(self.head)
+
+        def distance(cell):
+            dx = abs(cell % self.width - head_x)
+            dy = abs(cell // self.width - head_y)
+            return min(dx, self.width - dx) + min(dy, self.height - dy)
+
+        return min(apples, key=distance)
+
+    def is_occupied(self, cell: int) -> bool:
+        """Return True if a segment of any snake lies on the cell."""
+        return self.arena.occupied[cell] > 0
+
+
+class Arena(Occupancy):
+    """The class describing the board shared by several snakes."""
+
+    def __init__(self, width: int, height: int, snakes: int,
+                 apples=ARENA_APPLES, seed=None):
+        """Initialize the arena with snakes spread over the board."""
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.apples_count = apples
+        # Every game gets its own seed, so it can be played again:
+        self._seeds = Random(seed)
+        self.snakes = [ArenaSnake(self, start)
+                       for start in self._starts(snakes)]
+        self.reset()
+
+    def _starts(self, snakes: int) -> list:
+        """Return start cells of snakes in the middles of grid blocks."""
+        columns = ceil(sqrt(snakes))
+        rows = ceil(snakes / columns)
+        if columns > self.width or rows > self.height:
+            raise ValueError('Too many snakes for the board')
+        return [((index // columns * self.height + self.height // 2) // rows
+                 * self.width
+                 + (index % columns * self.width + self.width // 2)
+                 // columns)
+                for index in range(snakes)]
+
+    @property
+    def alive(self) -> list:
+        """Return snakes still on the board."""
+        return [snake for snake in self.snakes if not snake.lost]
+
+    @property
+    def done(self) -> bool:
+        """Return True if at most one snake is left (none if alone)."""
+        return len(self.alive) <= (len(self.snakes) > 1)
+
+    @property
+    def winner(self):
+        """Return the living snake with the highest score, if any."""
+        return max(self.alive, key=lambda snake: snake.score, default=None)
+
+    def reset(self, seed=None):
+        """Put all snakes on their start cells and place new apples.
+
+        The seed defines apple positions, a new one is used if not given.
+        """
+        if seed is None:
+            seed = self._seeds.getrandbits(32)
+        self.seed = seed
+        self.random = Random(seed)
+        self.ticks = 0
+        # The occupancy is shared by all snakes:
+        self._clear_occupancy()
+        for snake in self.snakes:
+            snake._place_snake(snake.start)
+            snake.won = snake.lost = False
+            self._occupy(snake.start)
+        # Apple cells in the order of placing and flags of all cells:
+        self.apples = []
+        self.apple_cells = bytearray(self.size)
+        for _ in range(self.apples_count):
+            self.place_apple()
+
+    def place_apple(self) -> bool:
+        """Put an apple on a random free cell, return False if none left."""
+        free_cells = self.free_cells
+        if len(free_cells) <= len(self.apples):
+            return False
+        cell = free_cells[self.random.randrange(len(free_cells))]
+        # Apples lie on free cells too, so the cell may be taken:
+        while self.apple_cells[cell]:
+            cell = free_cells[self.random.randrange(len(free_cells))]
+        self.apple_cells[cell] = 1
+        self.apples.append(cell)
+        return True
+
+    def step(self, actions=None) -> list:
+        """Advance all living snakes by one tick.
+
+        Actions are optional new directions of snakes (or None)
+        in the order of snakes. Return the events of every snake.
+        """
+        events = [MOVED] * len(self.snakes)
+        moving = []
+        # How many heads are going to every cell:
+        targets = {}
+        for index, snake in enumerate(self.snakes):
+            if snake.lost:
+                continue
+            if actions is not None and actions[index] is not None:
+                snake.turn(actions[index])
+            snake.turned = bool(snake.turns)
+            if snake.turned:
+                snake.prev_direction = snake.direction
+                snake.direction = snake.turns.popleft()
+            snake.prev_head = snake.body[0]
+            head = snake.next_cell(snake.prev_head, snake.direction)
+            targets[head] = targets.get(head, 0) + 1
+            # When the apple is eaten on the previous tick the snake grows:
+            if snake.length == len(snake.body) + 1:
+                snake.last = None
+            else:
+                snake.last = snake._pop_tail()
+                self._release(snake.last)
+            moving.append((index, snake, head))
+        # Cells are checked after all tails have left them
+        # and before any head is put on them:
+        died = [targets[head] > 1 or self.occupied[head]
+                for _, _, head in moving]
+        eaten = 0
+        for (index, snake, head), collided in zip(moving, died):
+            if collided:
+                snake.lost = True
+                for cell in snake.body:
+                    self._release(cell)
+                events[index] = DIED
+                continue
+            snake._push_head(head)
+            self._occupy(head)
+            if self.apple_cells[head]:
+                self.apple_cells[head] = 0
+                self.apples.remove(head)
+                snake.length += 1
+                events[index] = ATE
+                eaten += 1
+        # New apples are placed when all heads are on the board:
+        for _ in range(eaten):
+            self.place_apple()
+        self.ticks += 1
+        return events
+
+
+def play(arena: Arena, policies: list, max_ticks: int) -> Arena:
+    """Play one game with a policy for every snake, return the arena."""
+    snakes = arena.snakes
+    while not arena.done and arena.ticks < max_ticks:
+        arena.step([None if snake.lost else policy(snake)
+                    for snake, policy in zip(snakes, policies)])
+    return arena
+
+
+def main():
+    """Play arena games and print their results."""
+    parser = argparse.ArgumentParser(description='Several snakes on a board.')
+    parser.add_argument('--snakes', type=int, default=8)
+    parser.add_argument('--apples', type=int, default=ARENA_APPLES)
+    parser.add_argument('--policy', choices=POLICIES, default='greedy',
+                        help='the bot playing snakes of no player')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--board', type=int, nargs=2,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        default=(BOARD_WIDTH, BOARD_HEIGHT),
+                        help='board size in cells')
+    parser.add_argument('--render', action='store_true',
+                        help='show the games in the window')
+    parser.add_argument('--players', type=int, choices=(0, 1, 2),
+                        default=0, help='snakes played with the keyboard '
+                        '(arrows and WASD), they need --render')
+    parser.add_argument('--difficulty', choices=DIFFICULTIES,
+                        default='hard', help='the speed of shown games')
+    args = parser.parse_args()
+    if args.players and not args.render:
+        parser.error('--players needs --render')
+    if args.players > args.snakes:
+        parser.error('--players can not be more than --snakes')
+
+    arena = Arena(*args.board, args.snakes, args.apples, args.seed)
+    policies = [None] * args.players + [
+        POLICIES[args.policy](*args.board, index)
+        for index in range(args.players, args.snakes)
+    ]
+    started_at = time.perf_counter()
+    total_ticks = 0
+    for game in range(args.games):
+        if game:
+            arena.reset()
+            for policy in policies:
+                if policy is not None:
+                    policy.reset()
+        if args.render:
+            from the_snake import play_arena
+            play_arena(arena, policies, args.difficulty)
+        else:
+            play(arena, policies, MAX_TICKS)
+        total_ticks += arena.ticks
+        winner = arena.winner
+        scores = ' '.join(str(snake.score) for snake in arena.snakes)
+        print(f'game {game + 1}: {arena.ticks} ticks, winner '
+              f'{arena.snakes.index(winner) + 1 if winner else "none"}, '
+              f'scores {scores}')
+    elapsed = time.perf_counter() - started_at
+    print(f'{args.games} games in {elapsed:.1f} s, '
+          f'{total_ticks / elapsed:.0f} ticks/s '
+          f'with {args.snakes} snakes')
+
+
+if __name__ == '__main__':
+    main()
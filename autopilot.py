@@ -0,0 +1,243 @@
+"""The autopilot steering the snake to the apple by the shortest way.
+
+The way is searched with A* on the wrapping board and kept between
+ticks. While the snake follows it, cells ahead of the head stay free
+(the tail only frees cells), so every tick only the next cell is
+checked and the way is searched again only when the apple moves,
+the snake leaves the way or the next cell is taken by another snake.
+
+Before going to the apple the autopilot checks that the snake will
+still reach its tail after eating it. Otherwise it steps away from the
+apple keeping the tail reachable until the way to the apple is safe.
+"""
+from heapq import heappop, heappush
+from itertools import islice
+
+from game_state import GameState
+
+# Cells all searches of one tick may expand together. An expansion
+# takes about 5 us on a 1000x1000 board, so the slowest tick takes
+# about a third of the tick time of the hard difficulty (33 ms):
+SEARCH_BUDGET = 2_000
+# When the way to the apple is not safe, it is searched again
+# only every this many ticks:
+APPLE_RETRY_TICKS = 8
+
+
+class Autopilot:
+    """The bot following the cached shortest way to the apple.
+
+    It is a policy of bots.py: it is called with the game state before
+    every tick and returns the direction to turn to or None.
+    """
+
+    def __init__(self, width: int, height: int, seed=None,
+                 search_budget=SEARCH_BUDGET):
+        """Initialize the autopilot for the board."""
+        self.width = width
+        self.height = height
+        self.search_budget = search_budget
+        # Cells the searches of this tick may still expand:
+        self.budget = search_budget
+        self.searches = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the way of the last game, call it on a new game."""
+        # Cells of the kept way after the head, the next cell goes last:
+        self.way = []
+        # The apple the way leads to (None if it leads to the tail)
+        # and the head the next cell of the way is next to:
+        self.apple = None
+        self.planned_head = None
+        # Ticks the snake has not gone to the apple as it was not safe:
+        self.stalled = 0
+
+    def _neighbours(self, cell: int) -> tuple:
+        """Return the four neighbours of the cell on the wrapping board."""
+        width = self.width
+        y, x = divmod(cell, width)
+        row = y * width
+        return (
+            (y - 1) % self.height * width + x,
+            row + (x + 1) % width,
+            (y + 1) % self.height * width + x,
+            row + (x - 1) % width,
+        )
+
+    def distance(self, cell: int, other: int) -> int:
+        """Return the number of steps between cells on the empty board."""
+        y, x = divmod(cell, self.width)
+        other_y, other_x = divmod(other, self.width)
+        # The board wraps, so the cell may be closer the other way:
+        dx = abs(x - other_x)
+        dy = abs(y - other_y)
+        return min(dx, self.width - dx) + min(dy, self.height - dy)
+
+    def search(self, start: int, goal: int, is_blocked,
+               behind=None) -> list:
+        """Return the shortest way from the start to the goal cell.
+
+        The way is a list of cells after the start, the goal goes first.
+        The goal is reached even if it is blocked, the cell behind
+        the start can't be the first step. Return None if there is
+        no way or the budget of the tick has run out.
+        """
+        self.searches += 1
+        width = self.width
+        height = self.height
+        goal_y, goal_x = divmod(goal, width)
+
+        def distance(cell):
+            y, x = divmod(cell, width)
+            dx = abs(x - goal_x)
+            dy = abs(y - goal_y)
+            return min(dx, width - dx) + min(dy, height - dy)
+
+        neighbours = self._neighbours
+        came_from = {start: None}
+        costs = {start: 0}
+        # Ties go to cells closer to the goal, so the way stays straight:
+        frontier = [(distance(start), distance(start), start)]
+        budget = self.budget
+        while frontier:
+            _, _, cell = heappop(frontier)
+            if cell == goal:
+                way = []
+                while cell != start:
+                    way.append(cell)
+                    cell = came_from[cell]
+                self.budget = budget
+                return way
+            budget -= 1
+            if budget < 0:
+                self.budget = 0
+                return None
+            cost = costs[cell] + 1
+            for neighbour in neighbours(cell):
+                if (neighbour in costs and costs[neighbour] <= cost
+                   or neighbour != goal and is_blocked(neighbour)
+                   or cell == start and neighbour == behind):
+                    continue
+                costs[neighbour] = cost
+                came_from[neighbour] = cell
+                left = distance(neighbour)
+                heappush(frontier, (cost + left, left, neighbour))
+        self.budget = budget
+        return None
+
+    def _tail_reachable(self, state: GameState, way: list) -> bool:
+        """Check if the snake reaches its tail after going the way."""
+        body = state.body
+        steps = len(way)
+        # The snake grows by one cell a tick until it has its length,
+        # the apple adds one cell more:
+        length = min(state.length + 1, len(body) + steps)
+        if length <= steps:
+            new_body = way[:length]
+            left = set(body)
+        else:
+            new_body = way + list(islice(body, length - steps))
+            left = set(islice(reversed(body), len(body) - (length - steps)))
+        tail = new_body[-1]
+        if tail == way[0]:
+            return True
+        walls = set(new_body)
+
+        def is_blocked(cell):
+            return cell in walls or (state.is_occupied(cell)
+                                     and cell not in left)
+
+        return self.search(way[0], tail, is_blocked) is not None
+
+    def _plan(self, state: GameState, behind: int) -> list:
+        """Return a safe way to the apple or the next safe cell.
+
+        Return None if no cell is safe or the budget has run out.
+        """
+        head = state.head
+        tail = state.tail
+        # The tail leaves its cell unless the snake grows:
+        tail_leaves = state.length == len(state.body)
+
+        def is_blocked(cell):
+            return state.is_occupied(cell) and not (tail_leaves
+                                                    and cell == tail)
+
+        apple = state.apple
+        if apple is not None and self.stalled % APPLE_RETRY_TICKS == 0:
+            way = self.search(head, apple, is_blocked, behind)
+            # Circling for long, the snake risks going to the apple,
+            # so the game always ends:
+            if way is not None and (self.stalled > state.size
+                                    or self._tail_reachable(state, way)):
+                self.apple = apple
+                self.stalled = 0
+                return way
+            if not self.budget:
+                return None
+        # Going away from the apple while the tail stays reachable,
+        # so the snake doesn't circle after its tail forever:
+        steps = [cell for cell in self._neighbours(head)
+                 if cell != behind and not is_blocked(cell)]
+        if apple is not None:
+            steps.sort(key=lambda cell: -self.distance(cell, apple))
+        for cell in steps:
+            if self._tail_reachable(state, [cell]):
+                self.apple = None
+                self.stalled += 1
+                return [cell]
+            if not self.budget:
+                break
+        return None
+
+    def _way_is_kept(self, state: GameState) -> bool:
+        """Check if the kept way can be followed on this tick."""
+        way = self.way
+        if not way or self.apple not in (None, state.apple):
+            return False
+        next_cell = way[-1]
+        return (not state.is_occupied(next_cell)
+                or next_cell == state.tail
+                and state.length == len(state.body))
+
+    def next_cell(self, state: GameState):
+        """Return the cell the head should move to, None if all are taken.
+
+        The kept way is followed while it is valid, a new way is searched
+        otherwise. All searches share the budget of the tick, when it
+        runs out the snake only steps to a free cell.
+        """
+        self.budget = self.search_budget
+        head = state.head
+        if head != self.planned_head:
+            if self.way and self.way[-1] == head:
+                # The snake has made the step of the way:
+                self.way.pop()
+            else:
+                self.way = []
+            self.planned_head = head
+        current = state.next_direction
+        behind = state.next_cell(head, (-current[0], -current[1]))
+        if not self._way_is_kept(state):
+            self.way = self._plan(state, behind) or []
+        if self.way:
+            return self.way[-1]
+        # No safe way at all (or no time to find it), just not hitting
+        # anything for now and getting closer to the apple:
+        steps = [cell for cell in self._neighbours(head)
+                 if cell != behind and not state.is_occupied(cell)]
+        if not steps:
+            return None
+        if state.apple is not None:
+            return min(steps, key=lambda cell: self.distance(cell,
+                                                             state.apple))
+        return steps[0]
+
+    def __call__(self, state: GameState):
+        """Return the direction to the next cell of the way."""
+        cell = self.next_cell(state)
+        if cell is None:
+            return None
+        direction = state.direction_to(state.head, cell)
+        return None if direction == state.next_direction else direction
@@ -0,0 +1,140 @@
+"""Many Snake games stepped at once with NumPy.
+
+BatchGameState follows the same rules as game_state.GameState, but keeps
+N boards in arrays and advances all of them with one step() call.
+Directions are given by their codes: indices in game_state.DIRECTIONS.
+"""
+import numpy as np
+
+from game_state import ATE, DIED, DIRECTIONS, MOVED, SNAKE_DEF_LENGTH, WON
+
+# No turn for the board in the actions array:
+NO_TURN = -1
+
+_DX = np.array([direction[0] for direction in DIRECTIONS], dtype=np.int64)
+_DY = np.array([direction[1] for direction in DIRECTIONS], dtype=np.int64)
+_RIGHT = DIRECTIONS.index((1, 0))
+
+
+class BatchGameState:
+    """The class describing N independent games on boards of one size.
+
+    Every snake body is a ring buffer of cells: the head is at
+    head_index and the tail is body_length - 1 cells behind it.
+    """
+
+    def __init__(self, boards: int, width: int, height: int, start=None,
+                 seed=None):
+        """Initialize the games."""
+        self.boards = boards
+        self.width = width
+        self.height = height
+        self.size = width * height
+        if start is None:
+            start = (width // 2, height // 2)
+        self.start = start[1] * width + start[0]
+        self.random = np.random.default_rng(seed)
+        self.rows = np.arange(boards)
+        # Number of snake segments on every cell of every board:
+        self.occupied = np.zeros((boards, self.size), dtype=np.uint8)
+        self.body = np.zeros((boards, self.size), dtype=np.int64)
+        self.head_index = np.zeros(boards, dtype=np.int64)
+        self.body_length = np.zeros(boards, dtype=np.int64)
+        self.length = np.zeros(boards, dtype=np.int64)
+        self.direction = np.zeros(boards, dtype=np.int64)
+        self.apple = np.zeros(boards, dtype=np.int64)
+        self.ticks = np.zeros(boards, dtype=np.int64)
+        self.won = np.zeros(boards, dtype=bool)
+        self.lost = np.zeros(boards, dtype=bool)
+        self.reset()
+
+    @property
+    def done(self) -> np.ndarray:
+        """Return the mask of finished games."""
+        return self.won | self.lost
+
+    @property
+    def head(self) -> np.ndarray:
+        """Return head cells of all snakes."""
+        return self.body[self.rows, self.head_index]
+
+    @property
+    def score(self) -> np.ndarray:
+        """Return scores of all games."""
+        return self.length - SNAKE_DEF_LENGTH
+
+    def reset(self, mask=None):
+        """Restart the games selected by the mask (all if not given)."""
+        rows = self.rows if mask is None else np.flatnonzero(mask)
+        if not len(rows):
+            return
+        self.occupied[rows] = 0
+        self.occupied[rows, self.start] = 1
+        self.head_index[rows] = 0
+        self.body[rows, 0] = self.start
+        self.body_length[rows] = 1
+        self.length[rows] = SNAKE_DEF_LENGTH
+        self.direction[rows] = _RIGHT
+        self.ticks[rows] = 0
+        self.won[rows] = False
+        self.lost[rows] = False
+        self._place_apples(rows)
+
+    def _place_apples(self, rows: np.ndarray):
+        """Put apples on random free cells, mark boards without them won."""
+        weights = self.random.random((len(rows), self.size))
+        weights[self.occupied[rows] > 0] = -1
+        cells = weights.argmax(axis=1)
+        free = weights[np.arange(len(rows)), cells] >= 0
+        self.apple[rows[free]] = cells[free]
+        self.won[rows[~free]] = True
+
+    def step(self, actions=None, auto_reset=False) -> np.ndarray:
+        """Advance all unfinished games by one tick.
+
+        The actions are direction codes or NO_TURN for every board.
+        Return events (game_state bit flags) of every board. Finished
+        games are restarted after the step if auto_reset is True.
+        """
+        events = np.full(self.boards, MOVED, dtype=np.int8)
+        rows = np.flatnonzero(~self.done)
+        if actions is not None:
+            actions = np.asarray(actions)[rows]
+            # Only turns to the left or right side are allowed:
+            turning = (actions != NO_TURN) & (
+                (actions - self.direction[rows]) % 2 == 1
+            )
+            self.direction[rows[turning]] = actions[turning]
+        direction = self.direction[rows]
+        head = self.body[rows, self.head_index[rows]]
+        x = (head % self.width + _DX[direction]) % self.width
+        y = (head // self.width + _DY[direction]) % self.height
+        new_head = y * self.width + x
+        # When the apple is eaten on the previous tick the snake grows:
+        moving = self.body_length[rows] == self.length[rows]
+        moving_rows = rows[moving]
+        tail_index = ((self.head_index[moving_rows]
+                       - self.body_length[moving_rows] + 1) % self.size)
+        tail = self.body[moving_rows, tail_index]
+        self.occupied[moving_rows, tail] -= 1
+        self.body_length[rows[~moving]] += 1
+        # The cell is checked before the head is put on it,
+        # so the tail cell left on this tick is free:
+        collided = self.occupied[rows, new_head] > 0
+        self.head_index[rows] = (self.head_index[rows] + 1) % self.size
+        self.body[rows, self.head_index[rows]] = new_head
+        self.occupied[rows, new_head] += 1
+        self.ticks[rows] += 1
+
+        ate = new_head == self.apple[rows]
+        eating_rows = rows[ate]
+        self.length[eating_rows] += 1
+        self._place_apples(eating_rows)
+        events[eating_rows] = ATE
+        events[eating_rows[self.won[eating_rows]]] |= WON
+        dying_rows = rows[collided & ~ate]
+        self.lost[dying_rows] = True
+        events[dying_rows] = DIED
+        if auto_reset:
+            self.reset(self.done)
+        return events
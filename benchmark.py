@@ -0,0 +1,234 @@
+"""Benchmarks of the game logic and rendering.
+
+    python benchmark.py                  # compare with the baseline
+    python benchmark.py --save-baseline  # remember current timings
+
+The window is opened with the SDL dummy video driver, so benchmarks
+run anywhere. Every benchmark is repeated several times and the median
+time per call is compared with the baseline. The exit code is 1
+if any benchmark is slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import sys
+from statistics import median
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame  # noqa: E402
+
+import the_snake  # noqa: E402
+from bots import HamiltonianPolicy  # noqa: E402
+from game_state import DIED, WON  # noqa: E402
+
+BASELINE_FILE = f'{the_snake.RESULTS_DIR}benchmark.json'
+# Allowed slowdown compared to the baseline:
+THRESHOLD = 0.2
+REPEATS = 7
+# Minimal time of one repeat, in seconds:
+MIN_REPEAT_TIME = 0.05
+BOARD_SIZE = the_snake.BOARD_WIDTH * the_snake.BOARD_HEIGHT
+# Changed areas marked by drawing benchmarks, they are dropped
+# as the game pushes them to the display every frame:
+DIRTY_RECTS = the_snake.renderer.dirty_rects
+SNAKE_LENGTHS = (2, 16, 128, BOARD_SIZE // 2, BOARD_SIZE)
+# Directions of the Hamiltonian cycle in every cell:
+CYCLE = HamiltonianPolicy(the_snake.BOARD_WIDTH,
+                          the_snake.BOARD_HEIGHT).directions
+
+# Benchmarks: {name: setup function returning the function to time}
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Register the benchmark setup function."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def make_snake(length: int) -> the_snake.Snake:
+    """Return the snake of the length following the Hamiltonian cycle.
+
+    The apple is taken off the board, so the snake never grows
+    and never collides, however long it moves.
+    """
+    snake = the_snake.Snake()
+    state = snake.state
+    cells = [state.start]
+    while len(cells) < length:
+        cells.append(state.next_cell(cells[-1], CYCLE[cells[-1]]))
+    cells.reverse()
+    state.load_body(cells, CYCLE[cells[1]] if length > 1 else state.direction)
+    state.apple = None
+    return snake
+
+
+def _moving(snake: the_snake.Snake):
+    """Return the function moving the snake along the cycle."""
+    state = snake.state
+
+    def move():
+        direction = CYCLE[state.head]
+        if direction != state.direction:
+            snake.update_direction(direction)
+        return snake.move()
+    return move
+
+
+def _register_snake_benchmarks(length: int):
+    """Register benchmarks depending on the snake length."""
+    @benchmark(f'move[{length}]')
+    def move():
+        """Move the snake and check the collision."""
+        return _moving(make_snake(length))
+
+    @benchmark(f'collision[{length}]')
+    def collision():
+        """Check if the head is in the snake positions."""
+        snake = make_snake(length)
+        head = snake.get_head_position
+        return lambda: head in snake.positions
+
+    @benchmark(f'apple[{length}]')
+    def apple():
+        """Place the apple on a free cell."""
+        state = make_snake(min(length, BOARD_SIZE - 1)).state
+        return state.place_apple
+
+    @benchmark(f'snake_draw[{length}]')
+    def snake_draw():
+        """Move and draw the snake."""
+        snake = make_snake(length)
+        move = _moving(snake)
+
+        def draw():
+            move()
+            snake.draw()
+            DIRTY_RECTS.clear()
+        return draw
+
+
+for snake_length in SNAKE_LENGTHS:
+    _register_snake_benchmarks(snake_length)
+
+
+@benchmark('erase_sprite')
+def erase_sprite():
+    """Erase one cell."""
+    snake = make_snake(2)
+    position = snake.get_head_position
+
+    def erase():
+        snake._erase_sprite(position)
+        DIRTY_RECTS.clear()
+    return erase
+
+
+@benchmark('text_draw')
+def text_draw():
+    """Draw the changed score."""
+    score = the_snake.Score(the_snake.SNAKE_DEF_LENGTH)
+    lengths = iter(range(10 ** 9))
+
+    def draw():
+        # Score is changed every time, so it is really drawn:
+        score.draw(next(lengths) % 100)
+        DIRTY_RECTS.clear()
+    return draw
+
+
+@benchmark('tick')
+def tick():
+    """Do everything main() does in one tick."""
+    snake = make_snake(BOARD_SIZE // 2)
+    move = _moving(snake)
+    apple = the_snake.Apple(snake)
+    snake.state.apple = snake.state.free_cells[0]
+    score = the_snake.Score(snake.length)
+    hightscore = the_snake.Hightscore(0)
+
+    def game_tick():
+        the_snake.handle_keys('easy', snake)
+        if move() & (DIED | WON):
+            snake.reset()
+        apple.draw()
+        snake.draw()
+        score.draw(snake.length)
+        hightscore.draw(snake.length)
+        the_snake.renderer.update()
+    return game_tick
+
+
+def measure(function) -> dict:
+    """Return timings of one call in microseconds."""
+    # Choosing the number of calls, so a repeat is long enough:
+    number = 1
+    while True:
+        started_at = perf_counter()
+        for _ in range(number):
+            function()
+        if perf_counter() - started_at >= MIN_REPEAT_TIME:
+            break
+        number *= 2
+    times = []
+    for _ in range(REPEATS):
+        started_at = perf_counter()
+        for _ in range(number):
+            function()
+        times.append((perf_counter() - started_at) / number * 1e6)
+    times.sort()
+    return {'median': median(times), 'min': times[0],
+            'spread': times[-2] - times[1]}
+
+
+def main():
+    """Run benchmarks and compare them with the baseline."""
+    parser = argparse.ArgumentParser(description='Snake benchmarks.')
+    parser.add_argument('names', nargs='*',
+                        help='benchmarks to run (all by default)')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    the_snake.app.open_window()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    timings = {}
+    regressions = []
+    for name, setup in BENCHMARKS.items():
+        if args.names and name not in args.names:
+            continue
+        function = setup()
+        # Areas drawn by the setup are not pushed by the benchmark:
+        DIRTY_RECTS.clear()
+        timings[name] = timing = measure(function)
+        line = (f'{name:<22} {timing["median"]:>10.2f} us '
+                f'(min {timing["min"]:.2f}, spread {timing["spread"]:.2f})')
+        if name in baseline:
+            change = timing['median'] / baseline[name]['median'] - 1
+            line += f' {change:+.0%}'
+            if change > args.threshold:
+                regressions.append(name)
+                line += ' REGRESSION'
+        print(line)
+    pygame.quit()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({**baseline, **timings}, file, indent=1)
+        print(f'Baseline saved to {args.baseline}')
+    elif regressions:
+        print(f'Slower than the baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Bots playing Snake.
+
+A policy is called with the GameState before every tick and returns
+the direction to turn to or None to keep going. Its reset() is called
+when a new game starts.
+"""
+from random import Random
+
+from autopilot import Autopilot
+from game_state import DIRECTIONS, GameState
+
+# How often the random bot turns:
+RANDOM_TURN_CHANCE = 0.2
+
+
+def _is_reverse(direction: tuple, other: tuple) -> bool:
+    """Check if the directions are opposite."""
+    return direction[0] == -other[0] and direction[1] == -other[1]
+
+
+def _is_safe(state: GameState, cell: int) -> bool:
+    """Check if the head may move to the cell on the next tick."""
+    if not state.is_occupied(cell):
+        return True
+    # The tail leaves its cell unless the snake grows:
+    return cell == state.tail and state.length == len(state.body)
+
+
+class RandomPolicy:
+    """The bot turning at random."""
+
+    def __init__(self, width: int, height: int, seed=None):
+        """Initialize the bot."""
+        self.random = Random(seed)
+
+    def reset(self):
+        """Do nothing, the bot keeps nothing between ticks."""
+
+    def __call__(self, state: GameState):
+        """Return a random direction sometimes."""
+        if self.random.random() < RANDOM_TURN_CHANCE:
+            return self.random.choice(DIRECTIONS)
+        return None
+
+
+class GreedyPolicy:
+    """The bot going to the apple by the shortest way if it is safe."""
+
+    def __init__(self, width: int, height: int, seed=None):
+        """Initialize the bot."""
+        self.width = width
+        self.height = height
+
+    def reset(self):
+        """Do nothing, the bot keeps nothing between ticks."""
+
+    def _preferred_directions(self, state: GameState) -> list:
+        """Return directions sorted from the best to the worst."""
+        head_x, head_y = state.coordinates(state.head)
+        apple_x, apple_y = state.coordinates(state.apple)
+        # The board wraps around, so the apple may be closer the other way:
+        dx = (apple_x - head_x) % self.width
+        if dx > self.width // 2:
+            dx -= self.width
+        dy = (apple_y - head_y) % self.height
+        if dy > self.height // 2:
+            dy -= self.height
+        return sorted(DIRECTIONS, key=lambda direction: -(
+            direction[0] * dx + direction[1] * dy
+        ))
+
+    def __call__(self, state: GameState):
+        """Return the direction to the apple avoiding the snake body."""
+        if state.apple is None:
+            return None
+        current = state.direction
+        for direction in self._preferred_directions(state):
+            if (not _is_reverse(direction, current)
+               and _is_safe(state, state.next_cell(state.head, direction))):
+                return None if direction == current else direction
+        return None
+
+
+class HamiltonianPolicy:
+    """The bot following a cycle through every cell, it always wins.
+
+    The cycle needs an even width or height of the board.
+    """
+
+    def __init__(self, width: int, height: int, seed=None):
+        """Initialize the bot and build the cycle."""
+        if height % 2 == 0:
+            order = self._cycle(width, height)
+        elif width % 2 == 0:
+            order = [(x, y) for y, x in self._cycle(height, width)]
+        else:
+            raise ValueError('The board has no Hamiltonian cycle')
+        # Direction of the cycle in every cell:
+        self.directions = [None] * (width * height)
+        for (x, y), (next_x, next_y) in zip(order, order[1:] + order[:1]):
+            self.directions[y * width + x] = (next_x - x, next_y - y)
+
+    def reset(self):
+        """Do nothing, the cycle is the same in every game."""
+
+    @staticmethod
+    def _cycle(width: int, height: int) -> list:
+        """Return cells of the cycle in order, the height must be even."""
+        order = [(x, 0) for x in range(width)]
+        for y in range(1, height):
+            columns = range(width - 1, 0, -1) if y % 2 else range(1, width)
+            order.extend((x, y) for x in columns)
+        order.extend((0, y) for y in range(height - 1, 0, -1))
+        return order
+
+    def __call__(self, state: GameState):
+        """Return the direction of the cycle."""
+        current = state.direction
+        direction = self.directions[state.head]
+        if direction == current:
+            return None
+        if _is_reverse(direction, current):
+            # The snake has not joined the cycle yet, going aside:
+            for direction in DIRECTIONS:
+                if (direction[0] != current[0] and direction[1] != current[1]
+                   and _is_safe(state,
+                                state.next_cell(state.head, direction))):
+                    return direction
+            return None
+        return direction
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyPolicy,
+    'hamiltonian': HamiltonianPolicy,
+    'autopilot': Autopilot,
+}
+
+
+def play(policy, state: GameState, max_ticks: int) -> GameState:
+    """Play one game with the policy, return the final state."""
+    step = state.step
+    while not (state.won or state.lost) and state.ticks < max_ticks:
+        step(policy(state))
+    return state
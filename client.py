@@ -0,0 +1,101 @@
+"""The thin client showing the game played on the Snake server.
+
+    python server.py &
+    python client.py [--port 8765 | --unix PATH]
+
+The client only sends pressed directions and draws the messages
+of the server, the game itself is played by the server.
+"""
+import argparse
+import socket
+
+import pygame
+
+from game_state import DIRECTIONS
+from server import DEFAULT_PORT, HELLO, MESSAGE, START, MirrorState, read_hello
+from the_snake import (DISPLAY_FPS, PLAYER_KEYS, SNAKE_DEF_LENGTH, Apple,
+                       Score, Snake, app, clock, is_quited, renderer)
+
+# Every key of both players turns the only snake:
+CLIENT_KEYS = {key: DIRECTIONS.index(direction)
+               for keys in PLAYER_KEYS for key, direction in keys.items()}
+
+
+def connect(port: int, unix_path=None) -> socket.socket:
+    """Connect to the server."""
+    if unix_path:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(unix_path)
+        return connection
+    return socket.create_connection(('127.0.0.1', port))
+
+
+def receive_exactly(connection: socket.socket, size: int) -> bytes:
+    """Receive the number of bytes from the blocking connection."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('The server has closed the connection')
+        data += chunk
+    return bytes(data)
+
+
+def play_online(connection: socket.socket):
+    """Show the game of the server until the window is closed."""
+    app.start()
+    app.wait_for_assets()
+    width, height, _ = read_hello(receive_exactly(connection, HELLO.size))
+    state = MirrorState(width, height)
+    snake = apple = None
+    score = Score(SNAKE_DEF_LENGTH)
+    connection.setblocking(False)
+    received = bytearray()
+    while True:
+        clock.tick(DISPLAY_FPS)
+        for event in pygame.event.get():
+            if is_quited(event):
+                connection.close()
+                app.quit()
+            elif event.type == pygame.KEYDOWN and event.key in CLIENT_KEYS:
+                connection.send(bytes((CLIENT_KEYS[event.key],)))
+        try:
+            data = connection.recv(64 * 1024)
+        except BlockingIOError:
+            data = None
+        if data == b'':
+            # The server has stopped:
+            app.quit()
+        if data:
+            received += data
+        # Drawing every tick received since the last frame:
+        messages = len(received) // MESSAGE.size
+        for kind, *message in MESSAGE.iter_unpack(
+            received[:messages * MESSAGE.size]
+        ):
+            state.apply(kind, *message)
+            if kind == START:
+                # The new game starts on the clean board:
+                snake = Snake(state)
+                apple = Apple(snake)
+            if snake.camera.follow(state.head):
+                snake.redraw()
+            apple.draw()
+            snake.draw()
+        del received[:messages * MESSAGE.size]
+        score.draw(state.length)
+        renderer.update()
+
+
+def main():
+    """Connect to the server and show the game."""
+    parser = argparse.ArgumentParser(description='Snake client.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='connect to the Unix socket instead of TCP')
+    args = parser.parse_args()
+    play_online(connect(args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Rendering of recorded or simulated games to images or a video.
+
+    python export.py results/replays/game.snr --out frames/
+    python export.py --policy autopilot --seed 1 --ticks 3000 --video a.mp4
+
+The game is drawn as in the window, but offscreen (the SDL dummy
+video driver) and as fast as possible. Frames are read right from
+the surface memory (32-bit surfaces): a video gets it piped to ffmpeg
+without any copy, for PNG files it is copied once and converted and
+compressed by worker threads (NumPy and zlib let other threads run).
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+
+import the_snake  # noqa: E402
+from bots import POLICIES  # noqa: E402
+from game_state import DIED, SNAKE_DEF_LENGTH, WON, GameState  # noqa: E402
+from replay import Replay  # noqa: E402
+
+FRAMES_DIR = 'results/frames/'
+PNG_COMPRESSION = 3
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# ffmpeg pixel formats of 32-bit surfaces by shifts of red, green, blue:
+RAW_FORMATS = {(16, 8, 0): 'bgr0', (0, 8, 16): 'rgb0'}
+
+
+def render_game(state: GameState, actions, every=1):
+    """Play the game offscreen, yield (tick, surface) every few ticks.
+
+    Actions are the directions (or None) of every tick. The last tick
+    of the game is always yielded.
+    """
+    snake = the_snake.Snake(state)
+    apple = the_snake.Apple(snake)
+    # There is no hightscore, the rest of the bar is only filled:
+    the_snake.fill_score_bar()
+    score = the_snake.Score(SNAKE_DEF_LENGTH)
+    renderer = the_snake.renderer
+    for action in actions:
+        if action is not None:
+            snake.update_direction(action)
+        events = snake.move()
+        apple.draw()
+        snake.draw()
+        score.draw(snake.length)
+        # Changed areas are presented as in the window:
+        renderer.update()
+        over = events & (DIED | WON)
+        if over or state.ticks % every == 0:
+            yield state.ticks, renderer.surface
+        if over:
+            break
+
+
+def policy_actions(policy, state: GameState, ticks: int):
+    """Iterate over the directions chosen by the policy for the ticks."""
+    for _ in range(ticks):
+        yield policy(state)
+
+
+def _png_chunk(kind: bytes, data) -> bytes:
+    """Return the PNG chunk."""
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+
+def write_png(file_name: str, pixels: np.ndarray, channels: tuple):
+    """Write 32-bit pixels (height x width x 4 bytes) to the PNG file.
+
+    Channels are indices of red, green and blue bytes of a pixel.
+    """
+    height, width, _ = pixels.shape
+    rows = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    rgb = rows[:, 1:].reshape(height, width, 3)
+    for index, channel in enumerate(channels):
+        rgb[:, :, index] = pixels[:, :, channel]
+    # The "up" filter: rows keep differences with the row above,
+    # so the background compresses better:
+    rows[1:, 1:] -= rows[:-1, 1:]
+    rows[:, 0] = 2
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    with open(file_name, 'wb') as file:
+        file.write(PNG_SIGNATURE + _png_chunk(b'IHDR', header)
+                   + _png_chunk(b'IDAT', zlib.compress(rows,
+                                                       PNG_COMPRESSION))
+                   + _png_chunk(b'IEND', b''))
+
+
+class PngWriter:
+    """The class writing frames to PNG files in worker threads."""
+
+    def __init__(self, directory: str, workers: int):
+        """Initialize the writer of the frames directory."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pool = ThreadPoolExecutor(workers)
+        # Frames being written, so only a few frames are kept in memory:
+        self.pending = deque()
+        self.max_pending = 2 * workers
+
+    def write(self, tick: int, surface: pygame.Surface):
+        """Copy the frame and write it in the background."""
+        width, height = surface.get_size()
+        # Byte indices of colors in the pixel:
+        channels = tuple(shift // 8 if sys.byteorder == 'little'
+                         else 3 - shift // 8
+                         for shift in surface.get_shifts()[:3])
+        # The surface is drawn again on the next tick, so its memory
+        # is copied as it is, workers do the rest:
+        pixels = np.frombuffer(surface.get_view('0'), dtype=np.uint8).copy()
+        self.pending.append(self.pool.submit(
+            write_png, f'{self.directory}frame-{tick:06d}.png',
+            pixels.reshape(height, width, 4), channels
+        ))
+        if len(self.pending) > self.max_pending:
+            self.pending.popleft().result()
+
+    def close(self):
+        """Wait until all frames are written."""
+        while self.pending:
+            self.pending.popleft().result()
+        self.pool.shutdown()
+
+
+class VideoWriter:
+    """The class piping frames to ffmpeg."""
+
+    def __init__(self, file_name: str, fps: float, surface: pygame.Surface):
+        """Start ffmpeg encoding frames of the surface size."""
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError('ffmpeg is needed to write videos')
+        width, height = surface.get_size()
+        # The surface memory is passed as it is if ffmpeg can read it:
+        self.raw_format = None
+        if (surface.get_bytesize() == 4
+           and surface.get_pitch() == width * 4):
+            self.raw_format = RAW_FORMATS.get(surface.get_shifts()[:3])
+        self.process = subprocess.Popen(
+            [ffmpeg, '-loglevel', 'error', '-y', '-f', 'rawvideo',
+             '-pix_fmt', self.raw_format or 'rgb24',
+             '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+             '-pix_fmt', 'yuv420p', file_name],
+            stdin=subprocess.PIPE
+        )
+
+    def write(self, tick: int, surface: pygame.Surface):
+        """Send the frame to ffmpeg."""
+        if self.raw_format:
+            self.process.stdin.write(surface.get_view('0'))
+        else:
+            self.process.stdin.write(np.ascontiguousarray(
+                pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+            ))
+
+    def close(self):
+        """Wait until ffmpeg has written the video."""
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError('ffmpeg has failed to write the video')
+
+
+def main():
+    """Render the replay or the bot game to images or a video."""
+    parser = argparse.ArgumentParser(description='Export Snake games.')
+    parser.add_argument('replay', nargs='?',
+                        help='the replay file (a bot plays if not given)')
+    parser.add_argument('--policy', choices=POLICIES, default='autopilot',
+                        help='the bot playing the game')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ticks', type=int, default=3000,
+                        help='maximal ticks of the bot game')
+    parser.add_argument('--board', type=int, nargs=2,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        default=(the_snake.BOARD_WIDTH,
+                                 the_snake.BOARD_HEIGHT),
+                        help='board size of the bot game in cells')
+    parser.add_argument('--every', type=int, default=1,
+                        help='export every this many ticks')
+    parser.add_argument('--out', default=FRAMES_DIR,
+                        help='the directory of PNG frames')
+    parser.add_argument('--video', metavar='FILE',
+                        help='write the video with ffmpeg instead of frames')
+    parser.add_argument('--fps', type=float,
+                        help='video frames per second '
+                        '(the game speed by default)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='threads writing PNG frames')
+    args = parser.parse_args()
+
+    if args.replay:
+        replay = Replay.load(args.replay)
+        state = replay.new_state()
+        actions = replay.actions()
+        difficulty = replay.difficulty or 'hard'
+    else:
+        state = GameState(*args.board, seed=args.seed)
+        actions = policy_actions(POLICIES[args.policy](*args.board,
+                                                       args.seed),
+                                 state, args.ticks)
+        difficulty = 'hard'
+    tick_rate = the_snake.DIFFICULTIES.get(difficulty, 30)
+
+    the_snake.app.open_window()
+    try:
+        if args.video:
+            writer = VideoWriter(args.video,
+                                 args.fps or tick_rate / args.every,
+                                 the_snake.renderer.surface)
+        else:
+            writer = PngWriter(args.out if args.out.endswith('/')
+                               else args.out + '/', args.workers)
+    except RuntimeError as error:
+        parser.error(str(error))
+    started_at = time.perf_counter()
+    frames = 0
+    for tick, surface in render_game(state, actions, args.every):
+        writer.write(tick, surface)
+        frames += 1
+    writer.close()
+    elapsed = time.perf_counter() - started_at
+    pygame.quit()
+    print(f'{frames} frames of {state.ticks} ticks in {elapsed:.1f} s, '
+          f'{state.ticks / elapsed:.0f} ticks/s '
+          f'({state.ticks / tick_rate / elapsed:.1f}x real time)')
+
+
+if __name__ == '__main__':
+    main()
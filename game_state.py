@@ -0,0 +1,295 @@
+"""The Snake game rules without any rendering (no pygame needed)."""
+from array import array
+from collections import deque
+from itertools import islice
+from random import Random
+
+UP = (0, -1)
+DOWN = (0, 1)
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+# All directions clockwise, their indices are used as direction codes:
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+DIRECTION_CODES = {direction: code
+                   for code, direction in enumerate(DIRECTIONS)}
+
+SNAKE_DEF_LENGTH = 2
+
+# How many turns can be queued ahead of the snake:
+TURN_QUEUE_SIZE = 3
+
+# Segments on cells (SnakeState.segments) are bytes of this flag,
+# the code of the direction the cell was entered with (bits 2-3)
+# and the code of the direction it was left with (bits 0-1):
+SEGMENT = 0x10
+
+# Events returned by GameState.step() (bit flags):
+MOVED = 0
+ATE = 1
+DIED = 2
+WON = 4
+
+
+class Board:
+    """The class describing the board geometry.
+
+    The board is a torus of width x height cells. Every cell is
+    an integer index: cell = y * width + x.
+    """
+
+    def __init__(self, width: int, height: int):
+        """Initialize the board."""
+        self.width = width
+        self.height = height
+        self.size = width * height
+
+    def cell(self, x: int, y: int) -> int:
+        """Return the index of the cell with (x, y) coordinates."""
+        return y * self.width + x
+
+    def coordinates(self, cell: int) -> tuple:
+        """Return (x, y) coordinates of the cell."""
+        y, x = divmod(cell, self.width)
+        return x, y
+
+    def next_cell(self, cell: int, direction: tuple) -> int:
+        """Return the neighbour of the cell in the direction."""
+        y, x = divmod(cell, self.width)
+        return ((y + direction[1]) % self.height * self.width
+                + (x + direction[0]) % self.width)
+
+    def direction_to(self, cell: int, neighbour: int) -> tuple:
+        """Return the direction from the cell to its neighbour."""
+        y, x = divmod(cell, self.width)
+        neighbour_y, neighbour_x = divmod(neighbour, self.width)
+        if neighbour_y == y:
+            return RIGHT if (neighbour_x - x) % self.width == 1 else LEFT
+        return DOWN if (neighbour_y - y) % self.height == 1 else UP
+
+
+def _segment(heading_in: tuple, heading_out: tuple) -> int:
+    """Return the segment byte of the cell entered and left so."""
+    return (SEGMENT | DIRECTION_CODES[heading_in] << 2
+            | DIRECTION_CODES[heading_out])
+
+
+class SnakeState(Board):
+    """The class describing one snake on the board and its turns."""
+
+    def _place_snake(self, start: int):
+        """Put the new snake on the start cell."""
+        self.length = SNAKE_DEF_LENGTH
+        # Snake cells, the head goes first:
+        self.body = deque((start,))
+        self.direction = RIGHT
+        self.prev_direction = RIGHT
+        # Directions the head entered every body cell with,
+        # so every segment knows its orientation:
+        self.headings = deque((RIGHT,))
+        # The segment on every cell, so cells in the window are drawn
+        # without walking the whole body:
+        self.segments = bytearray(self.size)
+        self.segments[start] = _segment(RIGHT, RIGHT)
+        self.turns = deque()
+        self.turned = False
+        self.prev_head = start
+        self.last = None
+
+    def _push_head(self, head: int):
+        """Put the new head entered with the current direction."""
+        code = DIRECTION_CODES[self.direction]
+        segments = self.segments
+        body = self.body
+        # The snake of one cell has just left it:
+        if body:
+            segments[body[0]] = segments[body[0]] & ~3 | code
+        segments[head] = SEGMENT | code << 2 | code
+        body.appendleft(head)
+        self.headings.appendleft(self.direction)
+
+    def _pop_tail(self) -> int:
+        """Remove the tail segment, return its cell."""
+        last = self.body.pop()
+        self.headings.pop()
+        self.segments[last] = 0
+        return last
+
+    def segment_headings(self, cell: int):
+        """Return directions the cell was entered and left with.
+
+        Return None if there is no segment of the snake on the cell.
+        """
+        segment = self.segments[cell]
+        if not segment:
+            return None
+        return DIRECTIONS[segment >> 2 & 3], DIRECTIONS[segment & 3]
+
+    @property
+    def head(self) -> int:
+        """Return the snake head cell."""
+        return self.body[0]
+
+    @property
+    def tail(self) -> int:
+        """Return the snake tail cell."""
+        return self.body[-1]
+
+    @property
+    def score(self) -> int:
+        """Return the score of the current game."""
+        return self.length - SNAKE_DEF_LENGTH
+
+    @property
+    def next_direction(self) -> tuple:
+        """Return the direction the snake will have after queued turns."""
+        return self.turns[-1] if self.turns else self.direction
+
+    def turn(self, direction: tuple) -> bool:
+        """Queue the turn, return False if it is not allowed."""
+        current = self.next_direction
+        # Only turns to the left or right side are allowed:
+        if (len(self.turns) >= TURN_QUEUE_SIZE
+           or direction[0] == current[0] or direction[1] == current[1]):
+            return False
+        self.turns.append(direction)
+        return True
+
+
+class Occupancy:
+    """The mixin counting snake segments on every cell of the board.
+
+    Free cells are kept too, so a random free cell is taken in O(1).
+    The class using it has the size attribute: the number of cells.
+    """
+
+    def _clear_occupancy(self):
+        """Make every cell free."""
+        # Number of snake segments on every cell:
+        self.occupied = bytearray(self.size)
+        # Cells without snakes in any order
+        # and position of every free cell in that array:
+        self.free_cells = array('i', range(self.size))
+        self._free_index = array('i', range(self.size))
+
+    def is_occupied(self, cell: int) -> bool:
+        """Return True if a snake segment lies on the cell."""
+        return self.occupied[cell] > 0
+
+    def _occupy(self, cell: int):
+        """Put a snake segment on the cell."""
+        if not self.occupied[cell]:
+            # Swap-remove the cell from the free cells:
+            index = self._free_index[cell]
+            last = self.free_cells.pop()
+            if last != cell:
+                self.free_cells[index] = last
+                self._free_index[last] = index
+        self.occupied[cell] += 1
+
+    def _release(self, cell: int):
+        """Remove a snake segment from the cell."""
+        self.occupied[cell] -= 1
+        if not self.occupied[cell]:
+            self._free_index[cell] = len(self.free_cells)
+            self.free_cells.append(cell)
+
+
+class GameState(SnakeState, Occupancy):
+    """The class describing the whole state of one game and its rules."""
+
+    def __init__(self, width: int, height: int, start=None, seed=None):
+        """Initialize the game state."""
+        super().__init__(width, height)
+        if start is None:
+            start = (width // 2, height // 2)
+        self.start = self.cell(*start)
+        # Every game gets its own seed, so it can be replayed:
+        self._seeds = Random(seed)
+        self.reset()
+
+    def reset(self, seed=None):
+        """Reset the game to its initial state.
+
+        The seed defines apple positions, a new one is used if not given.
+        """
+        if seed is None:
+            seed = self._seeds.getrandbits(32)
+        self.seed = seed
+        self.random = Random(seed)
+        self._clear_occupancy()
+        self._place_snake(self.start)
+        self._occupy(self.start)
+        self.won = False
+        self.lost = False
+        self.ticks = 0
+        self.apple = None
+        self.place_apple()
+
+    def load_body(self, cells: list, direction: tuple):
+        """Put the snake on the cells (the head goes first)."""
+        for cell in self.body:
+            self._release(cell)
+        self.body = deque(cells)
+        for cell in self.body:
+            self._occupy(cell)
+        self.length = len(self.body)
+        self.direction = self.prev_direction = direction
+        self.headings = deque(map(self.direction_to,
+                                  islice(self.body, 1, None), self.body))
+        # The tail is thought to be entered straight:
+        self.headings.append(self.headings[-1] if self.headings
+                             else direction)
+        self.segments = bytearray(self.size)
+        for cell, heading_in, heading_out in zip(
+            self.body, self.headings, (direction, *self.headings)
+        ):
+            self.segments[cell] = _segment(heading_in, heading_out)
+        self.turns.clear()
+        self.prev_head = self.body[0]
+        self.last = None
+
+    def place_apple(self) -> bool:
+        """Put the apple on a random free cell, return False if none left."""
+        free_cells = self.free_cells
+        if not free_cells:
+            self.won = True
+            return False
+        self.apple = free_cells[self.random.randrange(len(free_cells))]
+        return True
+
+    def step(self, action=None) -> int:
+        """Advance the game by one tick, return the events happened.
+
+        The action is an optional new direction. At most one queued
+        turn is applied per tick.
+        """
+        if action is not None:
+            self.turn(action)
+        self.turned = bool(self.turns)
+        if self.turned:
+            self.prev_direction = self.direction
+            self.direction = self.turns.popleft()
+        self.prev_head = self.body[0]
+        head = self.next_cell(self.prev_head, self.direction)
+        body = self.body
+        # When the apple is eaten on the previous tick the snake grows:
+        if self.length == len(body) + 1:
+            self.last = None
+        else:
+            self.last = self._pop_tail()
+            self._release(self.last)
+        # The cell is checked before the head is put on it,
+        # so the tail cell left on this tick is free:
+        collided = self.occupied[head]
+        self._push_head(head)
+        self._occupy(head)
+        self.ticks += 1
+        if head == self.apple:
+            self.length += 1
+            if not self.place_apple():
+                return ATE | WON
+            return ATE
+        if collided:
+            self.lost = True
+            return DIED
+        return MOVED
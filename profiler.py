@@ -0,0 +1,135 @@
+"""Frame timings of the game loop.
+
+The game loop calls lap() after every phase. Timings of the last
+frames are kept in ring buffers and can be exported to JSON or CSV.
+NullProfiler does nothing, it is used when profiling is off.
+"""
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+# Number of frames kept for every phase:
+PROFILE_FRAMES = 1024
+
+
+def percentile(values, percent: float) -> float:
+    """Return the value not exceeded by the percent of values."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Profiler:
+    """The class measuring how long every phase of the frame takes."""
+
+    def __init__(self, tick_rate: float, frames=PROFILE_FRAMES):
+        """Initialize the profiler for the game of tick_rate ticks/s."""
+        self.tick_time = 1 / tick_rate
+        self.frames = frames
+        # Seconds spent in every phase: {phase: deque}
+        self.phases = {}
+        # Whole frame times including waiting for the next tick:
+        self.frame_times = deque(maxlen=frames)
+        self.missed_ticks = 0
+        self.frames_count = 0
+        self._frame_started_at = None
+        self._lap_started_at = None
+
+    def start_frame(self):
+        """Start measuring the new frame."""
+        now = perf_counter()
+        if self._frame_started_at is not None:
+            frame_time = now - self._frame_started_at
+            self.frame_times.append(frame_time)
+            self.frames_count += 1
+        self._frame_started_at = self._lap_started_at = now
+
+    def count_missed(self, backlog: float):
+        """Count ticks played late, backlog is the game time not played.
+
+        Frames are shorter than ticks, so at most one tick is due
+        in time, more ticks are due only if the game is behind.
+        """
+        due = int(backlog / self.tick_time)
+        if due > 1:
+            self.missed_ticks += due - 1
+
+    def lap(self, phase: str):
+        """Save the time since the previous lap as the phase time."""
+        now = perf_counter()
+        self.add(phase, now - self._lap_started_at)
+        self._lap_started_at = now
+
+    def add(self, phase: str, seconds: float):
+        """Save the phase time."""
+        times = self.phases.get(phase)
+        if times is None:
+            times = self.phases[phase] = deque(maxlen=self.frames)
+        times.append(seconds)
+
+    def wrap(self, obj, name: str, phase: str):
+        """Measure every call of the object method as the phase."""
+        method = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            started_at = perf_counter()
+            result = method(*args, **kwargs)
+            self.add(phase, perf_counter() - started_at)
+            return result
+
+        setattr(obj, name, timed)
+
+    def summary(self) -> dict:
+        """Return FPS, frame time percentiles (ms) and missed ticks."""
+        frame_times = self.frame_times
+        total = sum(frame_times)
+        return {
+            'fps': len(frame_times) / total if total else 0.0,
+            'p50': percentile(frame_times, 50) * 1000,
+            'p99': percentile(frame_times, 99) * 1000,
+            'missed': self.missed_ticks,
+            'frames': self.frames_count,
+        }
+
+    def export(self, file_name: str):
+        """Save timings (ms) of the kept frames to a JSON or CSV file."""
+        phases = {'frame': self.frame_times, **self.phases}
+        if file_name.endswith('.csv'):
+            with open(file_name, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['phase', 'frame', 'ms'])
+                for phase, times in phases.items():
+                    for frame, seconds in enumerate(times):
+                        writer.writerow([phase, frame, seconds * 1000])
+        else:
+            trace = {
+                'summary': self.summary(),
+                'phases': {phase: {'p50': percentile(times, 50) * 1000,
+                                   'p99': percentile(times, 99) * 1000,
+                                   'ms': [seconds * 1000
+                                          for seconds in times]}
+                           for phase, times in phases.items()},
+            }
+            with open(file_name, 'w', encoding='utf-8') as file:
+                json.dump(trace, file, indent=1)
+
+
+class NullProfiler:
+    """The profiler doing nothing, so profiling costs nothing when off."""
+
+    def start_frame(self):
+        """Do nothing."""
+
+    def count_missed(self, backlog: float):
+        """Do nothing."""
+
+    def lap(self, phase: str):
+        """Do nothing."""
+
+    def wrap(self, obj, name: str, phase: str):
+        """Do nothing."""
+
+    def export(self, file_name: str):
+        """Do nothing."""
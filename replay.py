@@ -0,0 +1,190 @@
+"""Recording and playback of Snake games.
+
+A replay keeps the seed of the game and the turns applied on every tick,
+which is enough to simulate the game again exactly. Run this module
+to verify recorded games:
+
+    python replay.py results/replays/*.snr [--render]
+"""
+import argparse
+import os
+import struct
+import time
+
+from game_state import DIED, DIRECTIONS, WON, GameState
+
+REPLAYS_DIR = 'results/replays/'
+REPLAY_EXTENSION = '.snr'
+
+MAGIC = b'SNKR'
+VERSION = 1
+# magic, version, width, height, start cell, seed, ticks, score,
+# difficulty name length:
+HEADER = struct.Struct('<4sBHHIIIIB')
+
+# Direction codes in the file:
+DIRECTION_CODES = {direction: code
+                   for code, direction in enumerate(DIRECTIONS)}
+
+
+def _write_varint(buffer: bytearray, value: int):
+    """Append the non-negative number using 7 bits per byte."""
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varints(data: bytes):
+    """Iterate over numbers written by _write_varint()."""
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+
+
+class Replay:
+    """The class describing a recorded game."""
+
+    def __init__(self, width: int, height: int, start: int, seed: int,
+                 difficulty='', turns=None, ticks=0, score=0):
+        """Initialize the replay."""
+        self.width = width
+        self.height = height
+        self.start = start
+        self.seed = seed
+        self.difficulty = difficulty
+        # Turns applied during the game: [(tick, direction)]
+        self.turns = [] if turns is None else turns
+        self.ticks = ticks
+        self.score = score
+
+    @classmethod
+    def start_recording(cls, state: GameState, difficulty=''):
+        """Return an empty replay of the game just (re)started."""
+        return cls(state.width, state.height, state.start, state.seed,
+                   difficulty)
+
+    def record(self, state: GameState):
+        """Record the tick, call it after every GameState.step()."""
+        if state.turned:
+            self.turns.append((state.ticks, state.direction))
+        self.ticks = state.ticks
+        self.score = state.score
+
+    def new_state(self) -> GameState:
+        """Return the game state the recorded game started with."""
+        state = GameState(self.width, self.height,
+                          (self.start % self.width, self.start // self.width))
+        state.reset(self.seed)
+        return state
+
+    def actions(self):
+        """Iterate over the action of every tick: a direction or None."""
+        turns = iter(self.turns)
+        turn_tick, direction = next(turns, (None, None))
+        for tick in range(1, self.ticks + 1):
+            if tick == turn_tick:
+                yield direction
+                turn_tick, direction = next(turns, (None, None))
+            else:
+                yield None
+
+    def simulate(self) -> GameState:
+        """Play the game again without rendering, return the final state."""
+        state = self.new_state()
+        step = state.step
+        for action in self.actions():
+            if step(action) & (DIED | WON):
+                break
+        return state
+
+    def matches(self, state: GameState) -> bool:
+        """Check that the finished game has the recorded result."""
+        return state.ticks == self.ticks and state.score == self.score
+
+    def verify(self) -> bool:
+        """Check that the game gives the recorded result."""
+        return self.matches(self.simulate())
+
+    def to_bytes(self) -> bytes:
+        """Encode the replay.
+
+        Every turn is written as a varint: the number of ticks since
+        the previous turn shifted left by 2 bits plus the direction code.
+        """
+        difficulty = self.difficulty.encode('ascii')
+        data = bytearray(HEADER.pack(
+            MAGIC, VERSION, self.width, self.height, self.start, self.seed,
+            self.ticks, self.score, len(difficulty)
+        ))
+        data += difficulty
+        previous_tick = 0
+        for tick, direction in self.turns:
+            _write_varint(data, (tick - previous_tick) << 2
+                          | DIRECTION_CODES[direction])
+            previous_tick = tick
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Decode the replay."""
+        (magic, version, width, height, start, seed, ticks, score,
+         difficulty_length) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a Snake replay')
+        offset = HEADER.size + difficulty_length
+        difficulty = data[HEADER.size:offset].decode('ascii')
+        turns = []
+        tick = 0
+        for value in _read_varints(data[offset:]):
+            tick += value >> 2
+            turns.append((tick, DIRECTIONS[value & 3]))
+        return cls(width, height, start, seed, difficulty, turns, ticks,
+                   score)
+
+    def save(self, replays_dir=REPLAYS_DIR) -> str:
+        """Write the replay to a new file, return the file name."""
+        os.makedirs(replays_dir, exist_ok=True)
+        file_name = (f'{replays_dir}{self.difficulty or "game"}-'
+                     f'{time.strftime("%Y%m%d-%H%M%S")}-{self.seed:08x}'
+                     f'{REPLAY_EXTENSION}')
+        with open(file_name, 'wb') as file:
+            file.write(self.to_bytes())
+        return file_name
+
+    @classmethod
+    def load(cls, file_name: str):
+        """Read the replay from the file."""
+        with open(file_name, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+
+def main():
+    """Verify the replays, optionally showing them."""
+    parser = argparse.ArgumentParser(description='Play Snake replays.')
+    parser.add_argument('files', nargs='+', help='replay files')
+    parser.add_argument('--render', action='store_true',
+                        help='show the games in the window')
+    args = parser.parse_args()
+    for file_name in args.files:
+        replay = Replay.load(file_name)
+        started_at = time.perf_counter()
+        if args.render:
+            from the_snake import play_replay
+            verified = replay.matches(play_replay(replay))
+        else:
+            verified = replay.verify()
+        elapsed = time.perf_counter() - started_at
+        print(f'{file_name}: {replay.difficulty} score {replay.score}, '
+              f'{replay.ticks} ticks, '
+              f'{replay.ticks / max(elapsed, 1e-9):.0f} ticks/s, '
+              f'{"OK" if verified else "MISMATCH"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""The store of game results.
+
+Every game is appended to the SQLite log with its score, ticks,
+duration and time. Aggregates (hightscore, mean, score histogram)
+are updated in the same transaction, so reading them takes
+one row lookup and a crash never leaves them out of sync.
+"""
+import os
+import sqlite3
+import time
+from queue import Queue
+from threading import Thread
+
+# The player name for human games, bots use their policy names:
+PLAYER = 'human'
+# How long to wait for other processes writing to the store, in seconds:
+BUSY_TIMEOUT = 30
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    difficulty TEXT NOT NULL,
+    player TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    ticks INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aggregates (
+    difficulty TEXT NOT NULL,
+    player TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    hightscore INTEGER NOT NULL,
+    PRIMARY KEY (difficulty, player)
+);
+CREATE TABLE IF NOT EXISTS histogram (
+    difficulty TEXT NOT NULL,
+    player TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (difficulty, player, score)
+);
+'''
+
+
+def _connect(file_name: str) -> sqlite3.Connection:
+    """Open the store and create tables if needed."""
+    connection = sqlite3.connect(file_name, timeout=BUSY_TIMEOUT)
+    # The write-ahead log keeps the store consistent after a crash
+    # and does not block readers while a game is written:
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _write_games(connection: sqlite3.Connection, games: list):
+    """Append games and update aggregates in one transaction."""
+    timestamp = time.time()
+    with connection:
+        for difficulty, player, score, ticks, duration in games:
+            connection.execute(
+                'INSERT INTO games (difficulty, player, score, ticks, '
+                'duration, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                (difficulty, player, score, ticks, duration, timestamp)
+            )
+            connection.execute(
+                'INSERT INTO aggregates VALUES (?, ?, 1, ?, ?) '
+                'ON CONFLICT (difficulty, player) DO UPDATE SET '
+                'games = games + 1, '
+                'score_sum = score_sum + excluded.score_sum, '
+                'hightscore = MAX(hightscore, excluded.hightscore)',
+                (difficulty, player, score, score)
+            )
+            connection.execute(
+                'INSERT INTO histogram VALUES (?, ?, ?, 1) '
+                'ON CONFLICT (difficulty, player, score) DO UPDATE SET '
+                'games = games + 1', (difficulty, player, score)
+            )
+
+
+class ResultsStore:
+    """The class keeping results of all games.
+
+    Games are written by a background thread, so the game loop
+    does not wait for the disk.
+    """
+
+    def __init__(self, file_name: str):
+        """Initialize the store."""
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file_name = file_name
+        self.connection = _connect(file_name)
+        self._queue = Queue()
+        self._writer = None
+        # Games the writer thread has failed to write:
+        self.failed_games = 0
+
+    def get_results(self, difficulty: str, player=PLAYER) -> dict:
+        """Return hightscore, average score and number of games played."""
+        row = self.connection.execute(
+            'SELECT games, score_sum, hightscore FROM aggregates '
+            'WHERE difficulty = ? AND player = ?', (difficulty, player)
+        ).fetchone()
+        games, score_sum, hightscore = row or (0, 0, 0)
+        return {
+            'hightscore': hightscore,
+            'averange_score': score_sum / games if games else 0,
+            'games_played': games
+        }
+
+    def histogram(self, difficulty: str, player=PLAYER) -> dict:
+        """Return {score: number of games}."""
+        return dict(self.connection.execute(
+            'SELECT score, games FROM histogram '
+            'WHERE difficulty = ? AND player = ? ORDER BY score',
+            (difficulty, player)
+        ))
+
+    def percentile(self, difficulty: str, percent: float,
+                   player=PLAYER) -> int:
+        """Return the score not exceeded by the percent of games."""
+        histogram = self.histogram(difficulty, player)
+        needed = sum(histogram.values()) * percent / 100
+        games = 0
+        for score, score_games in histogram.items():
+            games += score_games
+            if games >= needed:
+                return score
+        return 0
+
+    def write_games(self, games: list):
+        """Write games [(difficulty, player, score, ticks, duration)] now.
+
+        All games are written in one transaction.
+        """
+        _write_games(self.connection, games)
+
+    def add_game(self, difficulty: str, score: int, ticks: int,
+                 duration: float, player=PLAYER):
+        """Write the game in the background."""
+        if self._writer is None:
+            self._writer = Thread(target=self._write_queued, daemon=True)
+            self._writer.start()
+        self._queue.put((difficulty, player, score, ticks, duration))
+
+    def _write_queued(self):
+        """Write games from the queue, it runs in the writer thread."""
+        # SQLite connections can not be shared between threads:
+        connection = None
+        while True:
+            game = self._queue.get()
+            try:
+                if connection is None:
+                    connection = _connect(self.file_name)
+                _write_games(connection, [game])
+            # The game is lost, but the thread must go on,
+            # else flush() would wait for it forever:
+            except Exception as error:
+                self.failed_games += 1
+                print(f'The game result is not saved: {error}')
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until all added games are written."""
+        self._queue.join()
+
+    def close(self):
+        """Write added games and close the store."""
+        self.flush()
+        self.connection.close()
+
+    def import_results(self, difficulty: str, hightscore: int,
+                       averange_score: int, games_played: int,
+                       player=PLAYER):
+        """Set aggregates from old statistics if there are none yet."""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO aggregates VALUES (?, ?, ?, ?, ?)',
+                (difficulty, player, games_played,
+                 averange_score * games_played, hightscore)
+            )
@@ -0,0 +1,297 @@
+"""The Snake server running many games in one asyncio process.
+
+    python server.py [--port 8765 | --unix PATH] [--difficulty hard]
+    python server.py --clients 300 --ticks 300  # check with loopback clients
+
+Clients send one byte per key press: the code of the direction
+(index in game_state.DIRECTIONS). Turns are checked by the game state
+on the server, so clients can't break the rules. Every tick the server
+sends a fixed size message with the new head, the cell left by the tail
+and the apple, which is enough to draw the game (see client.py).
+"""
+import argparse
+import asyncio
+import struct
+import time
+from random import Random
+
+from game_state import DIED, DIRECTIONS, WON, GameState, SnakeState
+
+DEFAULT_PORT = 8765
+MAGIC = b'SNKS'
+VERSION = 1
+# magic, version, board width, height, session id:
+HELLO = struct.Struct('<4sBHHI')
+# kind, events, head cell, cell left by the tail (-1 if none),
+# apple cell (-1 if none), snake length:
+MESSAGE = struct.Struct('<BBiiiI')
+# Message kinds: the game has started, the tick has been played:
+START = 0
+TICK = 1
+# Sessions with this many bytes not sent are too slow and dropped,
+# so a session never takes more memory than that:
+MAX_WRITE_BUFFER = 64 * 1024
+MAX_SESSIONS = 1000
+
+
+class MirrorState(SnakeState):
+    """The snake state rebuilt from server messages.
+
+    It has the GameState attributes used by the game views,
+    so the game can be drawn by a client as it is drawn locally.
+    """
+
+    def __init__(self, width: int, height: int):
+        """Initialize the state of the board size."""
+        super().__init__(width, height)
+        self.occupied = bytearray(self.size)
+        self.apple = None
+        self.won = False
+        self.lost = False
+        self._place_snake(0)
+
+    def is_occupied(self, cell: int) -> bool:
+        """Return True if a snake segment lies on the cell."""
+        return self.occupied[cell] > 0
+
+    def apply(self, kind: int, events: int, head: int, left: int,
+              apple: int, length: int):
+        """Apply the message from the server."""
+        self.apple = None if apple < 0 else apple
+        if kind == START:
+            self.occupied = bytearray(self.size)
+            self._place_snake(head)
+            self.occupied[head] = 1
+            self.won = self.lost = False
+            return
+        self.prev_head = self.body[0]
+        if left < 0:
+            self.last = None
+        else:
+            self.last = self._pop_tail()
+            self.occupied[left] -= 1
+        self.direction = self.direction_to(self.prev_head, head)
+        self._push_head(head)
+        self.occupied[head] += 1
+        self.length = length
+        self.won = bool(events & WON)
+        self.lost = bool(events & DIED)
+
+
+def read_hello(data: bytes) -> tuple:
+    """Return board width, height and session id from the server hello."""
+    magic, version, width, height, session_id = HELLO.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a Snake server')
+    return width, height, session_id
+
+
+def _message(state: GameState, kind: int, events=0) -> bytes:
+    """Return the message about the state."""
+    return MESSAGE.pack(
+        kind, events, state.head, -1 if state.last is None else state.last,
+        -1 if state.apple is None else state.apple, state.length
+    )
+
+
+class Session:
+    """One game played by one client."""
+
+    def __init__(self, session_id: int, state: GameState,
+                 writer: asyncio.StreamWriter):
+        """Initialize the session and tell the client about the game."""
+        self.id = session_id
+        self.state = state
+        self.writer = writer
+        writer.write(HELLO.pack(MAGIC, VERSION, state.width, state.height,
+                                session_id))
+        writer.write(_message(state, START))
+
+    def turn(self, data: bytes):
+        """Queue turns received from the client, unknown codes are ignored.
+
+        The turn queue of the game is bounded, so extra turns are dropped.
+        """
+        for code in data:
+            if code < len(DIRECTIONS):
+                self.state.turn(DIRECTIONS[code])
+
+    def step(self) -> bool:
+        """Play the tick and send it, return False if the client is slow."""
+        state = self.state
+        events = state.step()
+        self.writer.write(_message(state, TICK, events))
+        if events & (DIED | WON):
+            state.reset()
+            self.writer.write(_message(state, START))
+        buffered = self.writer.transport.get_write_buffer_size()
+        return buffered <= MAX_WRITE_BUFFER
+
+
+class GameServer:
+    """The class running all sessions on one tick timer."""
+
+    def __init__(self, width: int, height: int, tick_rate: float,
+                 max_sessions=MAX_SESSIONS, seed=None):
+        """Initialize the server."""
+        self.width = width
+        self.height = height
+        self.tick_rate = tick_rate
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.ticks = 0
+        self._seeds = Random(seed)
+        self._next_id = 0
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+        """Play the game of the connected client until it leaves."""
+        if len(self.sessions) >= self.max_sessions:
+            writer.close()
+            return
+        session = Session(self._next_id,
+                          GameState(self.width, self.height,
+                                    seed=self._seeds.getrandbits(32)),
+                          writer)
+        self._next_id += 1
+        self.sessions[session.id] = session
+        try:
+            while True:
+                data = await reader.read(64)
+                if not data:
+                    break
+                session.turn(data)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.pop(session.id, None)
+            writer.close()
+
+    async def run(self, ticks=None):
+        """Step all sessions at the tick rate, forever or for the ticks."""
+        loop = asyncio.get_running_loop()
+        tick_time = 1 / self.tick_rate
+        next_tick = loop.time()
+        while ticks is None or self.ticks < ticks:
+            next_tick += tick_time
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            for session in list(self.sessions.values()):
+                if not session.step():
+                    # Dropping the slow client, so its data doesn't pile up:
+                    self.sessions.pop(session.id, None)
+                    session.writer.transport.abort()
+            self.ticks += 1
+
+    def close(self) -> dict:
+        """Close all sessions, return their states: {session id: state}."""
+        states = {}
+        for session in self.sessions.values():
+            states[session.id] = session.state
+            session.writer.close()
+        self.sessions.clear()
+        return states
+
+
+async def loopback_client(port: int, seed: int) -> tuple:
+    """Play with random turns until the server closes, return the mirror.
+
+    Return (session id, mirror state).
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    width, height, session_id = read_hello(
+        await reader.readexactly(HELLO.size)
+    )
+    mirror = MirrorState(width, height)
+    random = Random(seed)
+    while True:
+        try:
+            message = await reader.readexactly(MESSAGE.size)
+        except asyncio.IncompleteReadError:
+            break
+        mirror.apply(*MESSAGE.unpack(message))
+        if random.random() < 0.2:
+            writer.write(bytes((random.randrange(len(DIRECTIONS)),)))
+    writer.close()
+    return session_id, mirror
+
+
+async def check_loopback(clients: int, ticks: int, tick_rate: float,
+                         width: int, height: int) -> bool:
+    """Play the games with loopback clients, check they see them right."""
+    server = GameServer(width, height, tick_rate, max_sessions=clients,
+                        seed=0)
+    listener = await asyncio.start_server(server.handle_client,
+                                          '127.0.0.1', 0, backlog=clients)
+    port = listener.sockets[0].getsockname()[1]
+    tasks = [asyncio.create_task(loopback_client(port, seed))
+             for seed in range(clients)]
+    while len(server.sessions) < clients:
+        await asyncio.sleep(0.01)
+    started_at = time.perf_counter()
+    await server.run(ticks)
+    elapsed = time.perf_counter() - started_at
+    states = server.close()
+    mirrors = dict(await asyncio.gather(*tasks))
+    listener.close()
+    await listener.wait_closed()
+    matched = sum(
+        list(mirror.body) == list(states[session_id].body)
+        and mirror.apple == states[session_id].apple
+        and mirror.length == states[session_id].length
+        for session_id, mirror in mirrors.items()
+    )
+    print(f'{clients} sessions, {ticks} ticks in {elapsed:.1f} s '
+          f'({ticks / elapsed:.1f} ticks/s of {tick_rate:g}), '
+          f'{matched} of {clients} clients in sync')
+    return matched == clients
+
+
+async def serve(server: GameServer, port: int, unix_path=None):
+    """Accept clients on the TCP port or the Unix socket forever."""
+    if unix_path:
+        listener = await asyncio.start_unix_server(
+            server.handle_client, unix_path, backlog=server.max_sessions
+        )
+    else:
+        listener = await asyncio.start_server(
+            server.handle_client, '127.0.0.1', port,
+            backlog=server.max_sessions
+        )
+    async with listener:
+        print(f'Serving on {unix_path or f"127.0.0.1:{port}"}')
+        await server.run()
+
+
+def main():
+    """Run the server or check it with loopback clients."""
+    from the_snake import BOARD_HEIGHT, BOARD_WIDTH, DIFFICULTIES
+
+    parser = argparse.ArgumentParser(description='Snake server.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on the Unix socket instead of TCP')
+    parser.add_argument('--difficulty', choices=DIFFICULTIES,
+                        default='hard')
+    parser.add_argument('--board', type=int, nargs=2,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        default=(BOARD_WIDTH, BOARD_HEIGHT),
+                        help='board size in cells')
+    parser.add_argument('--clients', type=int,
+                        help='check the server with loopback clients')
+    parser.add_argument('--ticks', type=int, default=300,
+                        help='ticks played by loopback clients')
+    args = parser.parse_args()
+    tick_rate = DIFFICULTIES[args.difficulty]
+    if args.clients:
+        in_sync = asyncio.run(check_loopback(args.clients, args.ticks,
+                                             tick_rate, *args.board))
+        raise SystemExit(0 if in_sync else 1)
+    try:
+        asyncio.run(serve(GameServer(*args.board, tick_rate), args.port,
+                          args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Streaming telemetry of played games.
+
+Every tick (tick number, head cell, eaten apple, death, turn made)
+and a summary of every game are written as JSON lines to a rotating
+file or sent to a local socket:
+
+    {"event": "tick", "session": "...", "tick": 12, "head": 395,
+     "ate": false, "died": false, "input": "UP"}
+    {"event": "session", "session": "...", "difficulty": "hard", ...}
+
+The game thread only collects ticks into batches, lines are made
+and written by a background thread. The file is rotated when it grows
+big, old files are compressed with gzip. Run this module to collect
+telemetry sent by games to the socket:
+
+    python telemetry.py --port 8766 [--file results/telemetry/all.jsonl]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import socket
+import time
+from queue import Full, Queue
+from threading import Thread
+from uuid import uuid4
+
+from game_state import ATE, DIED, DOWN, LEFT, RIGHT, UP, WON
+
+TELEMETRY_FILE = 'results/telemetry/telemetry.jsonl'
+DEFAULT_PORT = 8766
+# Ticks sent to the writer thread at once:
+BATCH_TICKS = 256
+# Batches not written yet, newer batches are dropped, so a slow disk
+# or socket never slows the game down:
+MAX_QUEUED_BATCHES = 64
+# The file is rotated when it is bigger than this, in bytes:
+MAX_FILE_SIZE = 16 * 1024 * 1024
+# Rotated files kept, older ones are removed:
+KEEP_FILES = 32
+# How often the socket is connected again after an error, in seconds:
+RECONNECT_DELAY = 5
+# How long connecting and sending may take, in seconds, so an unreachable
+# collector never holds up quitting the game:
+SOCKET_TIMEOUT = 1
+
+DIRECTION_NAMES = {UP: 'UP', DOWN: 'DOWN', LEFT: 'LEFT', RIGHT: 'RIGHT'}
+
+
+class RotatingFileSink:
+    """The file of JSON lines compressed into a new file when it is big."""
+
+    def __init__(self, file_name=TELEMETRY_FILE, max_size=MAX_FILE_SIZE,
+                 keep=KEEP_FILES):
+        """Open the file, telemetry is appended to it."""
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file_name = file_name
+        self.max_size = max_size
+        self.keep = keep
+        self.file = open(file_name, 'a', encoding='utf-8')
+
+    def write(self, lines: list):
+        """Write the lines, rotate the file if it has become big."""
+        self.file.writelines(lines)
+        self.file.flush()
+        if self.file.tell() >= self.max_size:
+            self.rotate()
+
+    def rotate(self):
+        """Compress the file into a new one and start the file again."""
+        self.file.close()
+        root, extension = os.path.splitext(self.file_name)
+        now = time.time()
+        # Milliseconds keep files rotated in one second in order,
+        # the random part keeps names of games running at once apart:
+        stamp = (f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}'
+                 f'-{int(now * 1000) % 1000:03d}')
+        rotated = f'{root}-{stamp}-{uuid4().hex[:8]}{extension}.gz'
+        with open(self.file_name, 'rb') as source:
+            with gzip.open(rotated, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        self.file = open(self.file_name, 'w', encoding='utf-8')
+        # Removing the oldest files, names start with the rotation time:
+        directory = os.path.dirname(self.file_name) or '.'
+        prefix = os.path.basename(root) + '-'
+        rotated_files = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith('.gz')
+        )
+        for name in rotated_files[:-self.keep]:
+            os.remove(os.path.join(directory, name))
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+
+class SocketSink:
+    """The sink sending JSON lines to the TCP port or the Unix socket.
+
+    Lines are dropped while there is no connection, the game goes on.
+    """
+
+    def __init__(self, address: str):
+        """Initialize the sink for 'host:port' or the Unix socket path."""
+        self.address = address
+        self.connection = None
+        self.connected_at = None
+        self.dropped_lines = 0
+
+    def _connect(self):
+        """Connect to the address if the last try was long enough ago."""
+        now = time.monotonic()
+        if (self.connected_at is not None
+           and now - self.connected_at < RECONNECT_DELAY):
+            return
+        self.connected_at = now
+        host, _, port = self.address.rpartition(':')
+        try:
+            if host and port.isdigit():
+                self.connection = socket.create_connection((host, int(port)),
+                                                           SOCKET_TIMEOUT)
+            else:
+                self.connection = socket.socket(socket.AF_UNIX,
+                                                socket.SOCK_STREAM)
+                self.connection.settimeout(SOCKET_TIMEOUT)
+                self.connection.connect(self.address)
+        except OSError:
+            self.connection = None
+
+    def write(self, lines: list):
+        """Send the lines."""
+        if self.connection is None:
+            self._connect()
+        if self.connection is None:
+            self.dropped_lines += len(lines)
+            return
+        try:
+            self.connection.sendall(''.join(lines).encode('utf-8'))
+        except OSError:
+            self.connection.close()
+            self.connection = None
+            self.dropped_lines += len(lines)
+
+    def close(self):
+        """Close the connection."""
+        if self.connection is not None:
+            self.connection.close()
+
+
+class Telemetry:
+    """The class streaming ticks and game summaries to the sink.
+
+    The sink is written by the background thread only.
+    """
+
+    def __init__(self, sink, batch_ticks=BATCH_TICKS):
+        """Initialize telemetry and start the writer thread."""
+        self.sink = sink
+        self.batch_ticks = batch_ticks
+        self.session = uuid4().hex
+        self.started_at = time.time()
+        # Ticks of the batch: [(tick, head, events, turn or None)]
+        self._ticks = []
+        self._queue = Queue(MAX_QUEUED_BATCHES)
+        self.dropped_batches = 0
+        self._writer = Thread(target=self._write_batches, daemon=True)
+        self._writer.start()
+
+    def tick(self, state, events: int):
+        """Collect the tick, call it after every GameState.step()."""
+        self._ticks.append((state.ticks, state.head, events,
+                            state.direction if state.turned else None))
+        if len(self._ticks) >= self.batch_ticks:
+            self._send()
+
+    def end_session(self, difficulty: str, state, duration: float):
+        """Send the summary of the game and start a new session."""
+        self._send({
+            'event': 'session',
+            'session': self.session,
+            'difficulty': difficulty,
+            'board': [state.width, state.height],
+            'seed': state.seed,
+            'score': state.score,
+            'ticks': state.ticks,
+            'won': state.won,
+            'duration': round(duration, 3),
+            'started_at': round(self.started_at, 3),
+        })
+        self.session = uuid4().hex
+        self.started_at = time.time()
+
+    def _send(self, summary=None):
+        """Pass collected ticks (and the summary) to the writer thread."""
+        try:
+            self._queue.put_nowait((self.session, self._ticks, summary))
+        except Full:
+            self.dropped_batches += 1
+        self._ticks = []
+
+    def _write_batches(self):
+        """Write batches from the queue, it runs in the writer thread."""
+        while True:
+            session, ticks, summary = self._queue.get()
+            try:
+                lines = [
+                    json.dumps({
+                        'event': 'tick', 'session': session, 'tick': tick,
+                        'head': head, 'ate': bool(events & ATE),
+                        'died': bool(events & DIED),
+                        'won': bool(events & WON),
+                        'input': DIRECTION_NAMES.get(turn),
+                    }) + '\n'
+                    for tick, head, events, turn in ticks
+                ]
+                if summary is not None:
+                    lines.append(json.dumps(summary) + '\n')
+                self.sink.write(lines)
+            # Any error only loses the batch, the thread must go on,
+            # else flush() would wait for it forever:
+            except Exception:
+                self.dropped_batches += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until all collected ticks are written."""
+        if self._ticks:
+            self._send()
+        self._queue.join()
+
+    def close(self):
+        """Write collected ticks and close the sink."""
+        self.flush()
+        self.sink.close()
+
+
+class NullTelemetry:
+    """The telemetry doing nothing, so it costs nothing when off."""
+
+    def tick(self, state, events: int):
+        """Do nothing."""
+
+    def end_session(self, difficulty: str, state, duration: float):
+        """Do nothing."""
+
+    def close(self):
+        """Do nothing."""
+
+
+async def collect(sink: RotatingFileSink, port: int, unix_path=None):
+    """Write lines sent by games to the sink until interrupted."""
+    async def receive(reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        # The end of the last line may come with the next data:
+        pending = b''
+        try:
+            while True:
+                data = await reader.read(64 * 1024)
+                if not data:
+                    break
+                *lines, pending = (pending + data).split(b'\n')
+                if lines:
+                    sink.write([line.decode('utf-8') + '\n'
+                                for line in lines])
+        finally:
+            writer.close()
+
+    if unix_path:
+        listener = await asyncio.start_unix_server(receive, unix_path)
+    else:
+        listener = await asyncio.start_server(receive, '127.0.0.1', port)
+    async with listener:
+        print(f'Collecting telemetry on {unix_path or f"127.0.0.1:{port}"} '
+              f'to {sink.file_name}')
+        await listener.serve_forever()
+
+
+def main():
+    """Collect telemetry sent by games to the socket."""
+    parser = argparse.ArgumentParser(description='Snake telemetry collector.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on the Unix socket instead of TCP')
+    parser.add_argument('--file', default=TELEMETRY_FILE,
+                        help='the file written, it is rotated when big')
+    args = parser.parse_args()
+    sink = RotatingFileSink(args.file)
+    try:
+        asyncio.run(collect(sink, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
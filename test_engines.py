@@ -0,0 +1,75 @@
+"""Checks of the NumPy engine and replays against GameState."""
+from random import Random
+
+import numpy as np
+import pytest
+
+from batch_state import NO_TURN, BatchGameState
+from bots import POLICIES
+from game_state import DIRECTIONS, GameState
+from replay import Replay
+
+BOARD_SIZES = ((5, 4), (6, 6), (32, 24))
+BOARDS = 8
+TICKS = 2000
+
+
+@pytest.mark.parametrize('width, height', BOARD_SIZES)
+def test_batch_follows_game_state(width, height):
+    """Every board of the batch gives the events and heads of GameState."""
+    random = Random(width * height)
+    batch = BatchGameState(BOARDS, width, height, seed=width)
+    states = [GameState(width, height) for _ in range(BOARDS)]
+    # Apples are placed by different generators, so they are copied:
+    for state, apple in zip(states, batch.apple):
+        state.apple = int(apple)
+    for _ in range(TICKS):
+        actions = [random.choice((NO_TURN, *range(len(DIRECTIONS))))
+                   for _ in range(BOARDS)]
+        running = ~batch.done
+        events = batch.step(np.array(actions))
+        for row, (state, action) in enumerate(zip(states, actions)):
+            if not running[row]:
+                continue
+            state_events = state.step(None if action == NO_TURN
+                                      else DIRECTIONS[action])
+            assert state_events == events[row]
+            assert state.head == batch.head[row]
+            assert state.length == batch.length[row]
+            if not state.won:
+                state.apple = int(batch.apple[row])
+        if batch.done.all():
+            break
+
+
+@pytest.mark.parametrize('policy_name', ('random', 'greedy'))
+def test_replay_round_trip(policy_name):
+    """The encoded and decoded replay gives the recorded game."""
+    state = GameState(12, 10, seed=7)
+    replay = Replay.start_recording(state, 'hard')
+    policy = POLICIES[policy_name](12, 10, 7)
+    while not (state.won or state.lost) and state.ticks < TICKS:
+        state.step(policy(state))
+        replay.record(state)
+    assert replay.turns
+    decoded = Replay.from_bytes(replay.to_bytes())
+    assert decoded.turns == replay.turns
+    assert decoded.difficulty == 'hard'
+    assert decoded.verify()
+
+
+def test_segments_follow_body():
+    """Segments on cells are the headings of the snake body."""
+    random = Random(3)
+    state = GameState(6, 5, seed=3)
+    for _ in range(TICKS):
+        if state.won or state.lost:
+            state.reset()
+        state.step(random.choice((None, *DIRECTIONS)))
+        if state.lost:
+            continue
+        headings = (state.direction, *state.headings)
+        for index, cell in enumerate(state.body):
+            assert state.segment_headings(cell) == (headings[index + 1],
+                                                    headings[index])
+        assert sum(map(bool, state.segments)) == len(state.body)
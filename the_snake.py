@@ -1,19 +1,36 @@
 """The Snake game."""
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
 from itertools import product
-from random import choice
 
 import pygame
 
+from autopilot import Autopilot
+from game_state import (ATE, DIED, DOWN, LEFT, RIGHT, SNAKE_DEF_LENGTH, UP,
+                        WON, GameState)
+from profiler import NullProfiler, Profiler
+from replay import Replay
+from results_store import ResultsStore
+from telemetry import NullTelemetry, RotatingFileSink, SocketSink, Telemetry
+
 SCREEN_WIDTH, SCREEN_HEIGHT = 1280, 1000
 GRID_SIZE = 40
 GAME_HEIGHT = SCREEN_HEIGHT - GRID_SIZE
-GAME_SPACE = [(i, j) for j in range(0, GAME_HEIGHT - GRID_SIZE, GRID_SIZE)
-              for i in range(0, SCREEN_WIDTH - GRID_SIZE, GRID_SIZE)]
-
-UP = (0, -1)
-DOWN = (0, 1)
-LEFT = (-1, 0)
-RIGHT = (1, 0)
+# The window size in cells:
+VIEW_WIDTH = SCREEN_WIDTH // GRID_SIZE
+VIEW_HEIGHT = GAME_HEIGHT // GRID_SIZE
+# The board size in cells. Set it up to 1000x1000 to play on a big board,
+# the camera follows the snake when the board doesn't fit the window:
+BOARD_WIDTH = VIEW_WIDTH
+BOARD_HEIGHT = VIEW_HEIGHT
+# The camera moves when the head is this close to the window edge, in cells:
+CAMERA_MARGIN = 4
+# Screen position of every cell of the window,
+# indexed by the window cell: y * VIEW_WIDTH + x
+CELL_POSITIONS = [(x * GRID_SIZE, y * GRID_SIZE)
+                  for y in range(VIEW_HEIGHT) for x in range(VIEW_WIDTH)]
 
 # Border color for "Game Over":
 GO_BORDER_COLOR = (5, 5, 5)
@@ -28,17 +45,51 @@ SCORE_BACKGROUND_COLOR = (200, 200, 200)
 GAME_OVER_COLOR = (195, 9, 9)
 VICTORY_COLOR = (20, 180, 20)
 
+# The frame around the cell the autopilot would go to:
+HINT_COLOR = (255, 255, 255)
+HINT_WIDTH = 3
+
+# Game ticks per second:
 DIFFICULTIES = {'easy': 10, 'medium': 20, 'hard': 30}
+# Frames per second, input is read and the screen is updated every frame:
+DISPLAY_FPS = 60
+# Longer frames are cut, so the game doesn't rush after a freeze:
+MAX_FRAME_TIME = 0.25
 DIFFICULTY_COLORS = {'easy': (0, 150, 0),
                      'medium': (150, 150, 0),
                      'hard': (150, 0, 0)}
 
-SNAKE_DEF_LENGTH = 2
-
 # Set this True if you don't want your results to be saved:
 DEBUG = False
 
+# Set this True to push the whole screen to the display every frame
+# instead of only the changed areas (useful for comparison):
+FULL_SCREEN_UPDATE = False
+
+# Set a number here to get the same apple positions in every run:
+SEED = None
+
+# Set this True to show frame timings in the score bar
+# and save them to PROFILE_FILE (.json or .csv) on exit:
+PROFILE = False
+
+# Set this True to stream every tick and summaries of games
+# to TELEMETRY_FILE (compressed into a new file when it is big)
+# or to TELEMETRY_SOCKET ('host:port' or a Unix socket path) if it is set:
+TELEMETRY = False
+TELEMETRY_SOCKET = None
+
+# Set this True to let the autopilot steer the snake
+# (its games are not saved to results):
+AUTOPILOT = False
+
+# Set this True to show the cell the autopilot would go to:
+AUTOPILOT_HINT = False
+
 RESULTS_DIR = 'results/'
+RESULTS_FILE = f'{RESULTS_DIR}results.sqlite3'
+PROFILE_FILE = f'{RESULTS_DIR}profile.json'
+TELEMETRY_FILE = f'{RESULTS_DIR}telemetry/telemetry.jsonl'
 
 # Specify graphic files:
 GRAPHICS_DIR = 'graphics/'
@@ -61,28 +112,35 @@ SCORE_POSITION = (SCREEN_WIDTH / 2, GAME_HEIGHT + GRID_SIZE / 2 + 4)
 
 HIGHTSCORE_POSITION = (2 * GRID_SIZE, GAME_HEIGHT + GRID_SIZE / 2 + 4)
 
-EVENT_TEXT_FONT_SIZE = SCREEN_WIDTH // 9
-# Setting outline positions so that it protrudes per BORDER_WIDTH on each side:
-CENTER_TEXT_OUTLINE_POS = product(
-    (CENTER_POSITION[0] - BORDER_WIDTH, CENTER_POSITION[0] + BORDER_WIDTH),
-    (CENTER_POSITION[1] - BORDER_WIDTH, CENTER_POSITION[1] + BORDER_WIDTH)
-)
+# The score bar is split between the hightscore, the score
+# and frame timings, so each of them is redrawn separately:
+SCORE_BAR_RECT = pygame.Rect((0, GAME_HEIGHT),
+                             (SCREEN_WIDTH, SCREEN_HEIGHT - GAME_HEIGHT))
+HIGHTSCORE_RECT = pygame.Rect((0, GAME_HEIGHT),
+                              (SCREEN_WIDTH // 4, SCREEN_HEIGHT - GAME_HEIGHT))
+SCORE_RECT = pygame.Rect((SCREEN_WIDTH // 4, GAME_HEIGHT),
+                         (SCREEN_WIDTH // 2, SCREEN_HEIGHT - GAME_HEIGHT))
+PROFILE_RECT = pygame.Rect((SCREEN_WIDTH * 3 // 4, GAME_HEIGHT),
+                           (SCREEN_WIDTH // 4, SCREEN_HEIGHT - GAME_HEIGHT))
+PROFILE_FONT_SIZE = GRID_SIZE // 2
+# How often frame timings on the screen are updated, in seconds:
+PROFILE_OVERLAY_PERIOD = 0.5
 
-DIFFICULTY_SIZE = SCREEN_WIDTH // 18
-
-# Create statistics files if does not exist:
-open(f'{RESULTS_DIR}easy.txt', 'a').close()
-open(f'{RESULTS_DIR}medium.txt', 'a').close()
-open(f'{RESULTS_DIR}hard.txt', 'a').close()
+EVENT_TEXT_FONT_SIZE = SCREEN_WIDTH // 9
+# Setting outline offsets so that it protrudes per BORDER_WIDTH on each side:
+TEXT_OUTLINE_OFFSETS = tuple(product((0, 2 * BORDER_WIDTH), repeat=2))
 
+# Maximal number of rendered inscriptions kept in the cache:
+TEXT_CACHE_SIZE = 128
 
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), 0, 100)
-icon = pygame.image.load(f'{GRAPHICS_DIR}SNAKE.ico')
-pygame.display.set_icon(icon)
-pygame.display.set_caption('Snake')
+DIFFICULTY_SIZE = SCREEN_WIDTH // 18
 
 clock = pygame.time.Clock()
 
+# Snake colors in the arena, None keeps the sprites as they are:
+SNAKE_COLORS = (None, (120, 170, 255), (255, 140, 140), (255, 230, 120),
+                (200, 140, 255), (130, 255, 210))
+
 DIRECTION_KEYS = {
     (pygame.K_s, RIGHT): DOWN,
     (pygame.K_s, LEFT): DOWN,
@@ -102,32 +160,464 @@ DIRECTION_KEYS = {
     (pygame.K_RIGHT, DOWN): RIGHT
 }
 
+# Keys of players in the arena, the first one uses arrows:
+PLAYER_KEYS = (
+    {pygame.K_UP: UP, pygame.K_DOWN: DOWN,
+     pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT},
+    {pygame.K_w: UP, pygame.K_s: DOWN, pygame.K_a: LEFT, pygame.K_d: RIGHT},
+)
+
+
+class Renderer:
+    """The class collecting changed screen areas and presenting them."""
 
-def get_free_positions(snake_positions: list) -> list:
-    """Return list of free cells on the game board."""
-    if snake_positions:
-        return list(set(GAME_SPACE) - set(snake_positions))
+    def __init__(self, surface=None, full_flip=False):
+        """Initialize the renderer over the surface.
+
+        The surface may be set later, when the window is opened.
+        """
+        self.surface = surface
+        self.full_flip = full_flip
+        self.dirty_rects = []
+        # The copy of what the display shows, tools checking changed
+        # areas set it, update() copies only those areas to it:
+        self.presented = None
+
+    def blit(self, source: pygame.surface.Surface, position,
+             area=None) -> pygame.Rect:
+        """Draw the source (or its area) and mark the area as changed."""
+        rect = self.surface.blit(source, position, area)
+        self.dirty_rects.append(rect)
+        return rect
+
+    def draw_rect(self, color, rect, width=0) -> pygame.Rect:
+        """Draw a rectangle (filled if no width) and mark it as changed."""
+        rect = pygame.draw.rect(self.surface, color, rect, width)
+        self.dirty_rects.append(rect)
+        return rect
+
+    def update(self):
+        """Push the changed areas (or the whole screen) to the display."""
+        if self.presented is not None:
+            for rect in ((self.surface.get_rect(),) if self.full_flip
+                         else self.dirty_rects):
+                self.presented.blit(self.surface, rect, rect)
+        if self.full_flip:
+            pygame.display.update()
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+        self.dirty_rects.clear()
+
+
+renderer = Renderer(full_flip=FULL_SCREEN_UPDATE)
+
+
+class Camera:
+    """The class choosing the part of the board shown in the window.
+
+    The board is a torus, so the camera wraps around it as well.
+    It never moves along the side of the board fitting the window.
+    """
+
+    __slots__ = ('width', 'height', 'x', 'y', 'positions')
+
+    def __init__(self, width: int, height: int):
+        """Initialize the camera over the board of width x height cells."""
+        self.width = width
+        self.height = height
+        # The board cell shown in the top left corner of the window:
+        self.x = 0
+        self.y = 0
+        # Screen positions of all cells if the board fits the window,
+        # so looking them up allocates nothing:
+        self.positions = None
+        if width <= VIEW_WIDTH and height <= VIEW_HEIGHT:
+            self.positions = [CELL_POSITIONS[y * VIEW_WIDTH + x]
+                              for y in range(height) for x in range(width)]
+
+    def position(self, cell: int):
+        """Return the screen position of the cell, None if it isn't shown."""
+        if self.positions is not None:
+            return self.positions[cell]
+        y, x = divmod(cell, self.width)
+        x = (x - self.x) % self.width
+        y = (y - self.y) % self.height
+        if x >= VIEW_WIDTH or y >= VIEW_HEIGHT:
+            return None
+        return CELL_POSITIONS[y * VIEW_WIDTH + x]
+
+    def cell(self, position: tuple):
+        """Return the board cell at the screen position or None."""
+        x, y = position
+        if x % GRID_SIZE or y % GRID_SIZE or x < 0 or y < 0:
+            return None
+        x //= GRID_SIZE
+        y //= GRID_SIZE
+        if (x >= min(VIEW_WIDTH, self.width)
+           or y >= min(VIEW_HEIGHT, self.height)):
+            return None
+        return ((y + self.y) % self.height * self.width
+                + (x + self.x) % self.width)
+
+    def visible_cells(self):
+        """Iterate over (cell, screen position) of cells in the window."""
+        width = self.width
+        height = self.height
+        for y in range(min(VIEW_HEIGHT, height)):
+            row = (y + self.y) % height * width
+            first = y * VIEW_WIDTH
+            for x in range(min(VIEW_WIDTH, width)):
+                yield row + (x + self.x) % width, CELL_POSITIONS[first + x]
+
+    def center(self, cell: int):
+        """Move the camera, so the cell is in the middle of the window."""
+        y, x = divmod(cell, self.width)
+        if self.width > VIEW_WIDTH:
+            self.x = (x - VIEW_WIDTH // 2) % self.width
+        if self.height > VIEW_HEIGHT:
+            self.y = (y - VIEW_HEIGHT // 2) % self.height
+
+    def follow(self, cell: int) -> bool:
+        """Center the cell if it is close to the window edge.
+
+        Return True if the camera has moved, so the window must be redrawn.
+        """
+        y, x = divmod(cell, self.width)
+        x = (x - self.x) % self.width
+        y = (y - self.y) % self.height
+        if ((self.width > VIEW_WIDTH
+             and not CAMERA_MARGIN <= x < VIEW_WIDTH - CAMERA_MARGIN)
+           or (self.height > VIEW_HEIGHT
+               and not CAMERA_MARGIN <= y < VIEW_HEIGHT - CAMERA_MARGIN)):
+            self.center(cell)
+            return True
+        return False
+
+
+class App:
+    """The class starting the game: the window, statistics and assets.
+
+    Nothing is done on import, the window is opened by start().
+    """
+
+    def __init__(self):
+        """Initialize the application."""
+        self.started_at = time.perf_counter()
+        self.startup_time = None
+        self.assets_loader = None
+        self.results = None
+        self.profiler = NullProfiler()
+        self.telemetry = NullTelemetry()
+
+    def open_window(self):
+        """Initialize pygame and open the game window."""
+        pygame.init()
+        renderer.surface = pygame.display.set_mode(
+            (SCREEN_WIDTH, SCREEN_HEIGHT), 0, 100
+        )
+        pygame.display.set_icon(pygame.image.load(f'{GRAPHICS_DIR}SNAKE.ico'))
+        pygame.display.set_caption('Snake')
+
+    def start(self):
+        """Open the window and prepare loading assets.
+
+        Assets are loaded by slices between menu frames, pygame
+        is not thread-safe, so it is done in the main thread.
+        """
+        self.open_window()
+        fill_score_bar()
+        self.results = ResultsStore(RESULTS_FILE)
+        import_text_results(self.results)
+        self.assets_loader = preload_assets()
+
+    def load_assets_slice(self):
+        """Load the next slice of assets, if any are left."""
+        if self.assets_loader is not None:
+            if next(self.assets_loader, None) is None:
+                self.assets_loader = None
+
+    def wait_for_assets(self):
+        """Load all assets which are not loaded yet."""
+        if self.assets_loader is not None:
+            for _ in self.assets_loader:
+                pass
+            self.assets_loader = None
+
+    def report_startup(self):
+        """Print the time from start to the first interactive frame."""
+        if self.startup_time is None:
+            self.startup_time = time.perf_counter() - self.started_at
+            print(f'Started in {self.startup_time * 1000:.0f} ms')
+
+    def start_profiling(self, tick_rate: float):
+        """Return the profiler of the game loop (doing nothing if off)."""
+        if PROFILE:
+            self.profiler = Profiler(tick_rate)
+        return self.profiler
+
+    def start_telemetry(self):
+        """Return the telemetry of games (doing nothing if off)."""
+        if TELEMETRY:
+            self.telemetry = Telemetry(
+                SocketSink(TELEMETRY_SOCKET) if TELEMETRY_SOCKET
+                else RotatingFileSink(TELEMETRY_FILE)
+            )
+        return self.telemetry
+
+    def quit(self):
+        """Wait for results and telemetry to be written, close the game."""
+        if self.results is not None:
+            self.results.flush()
+        self.telemetry.close()
+        self.profiler.export(PROFILE_FILE)
+        pygame.quit()
+        raise SystemExit
+
+
+app = App()
+
+
+# Asset cache. Every image is decoded, scaled and converted only once:
+# {(image_file, size, transform): surface}
+_images = {}
+# Background cells used to erase sprites: {position: surface}
+_background_cells = {}
+
+
+def _apply_transform(image: pygame.surface.Surface,
+                     transform: tuple) -> pygame.surface.Surface:
+    """Apply transform steps like ('flip', False, True) or ('rotate', 90)."""
+    for operation, *args in transform:
+        image = getattr(pygame.transform, operation)(image, *args)
+    return image
+
+
+def load_image(image_file: str, size=(GRID_SIZE, GRID_SIZE),
+               transform=()) -> pygame.surface.Surface:
+    """Load image and transform it, return pygame image surface.
+
+    Surfaces are cached by (file, size, transform) and converted
+    to the display pixel format, so blitting them is cheap.
+    """
+    key = (image_file, size, transform)
+    image = _images.get(key)
+    if image is None:
+        if transform:
+            image = _apply_transform(load_image(image_file, size), transform)
+        else:
+            image = pygame.transform.scale(
+                pygame.image.load(GRAPHICS_DIR + image_file), size
+            )
+            # Converting needs the window, tools may work without it:
+            if pygame.display.get_surface() is not None:
+                if image.get_flags() & pygame.SRCALPHA:
+                    image = image.convert_alpha()
+                else:
+                    image = image.convert()
+        _images[key] = image
+    return image
+
+
+def get_background_cell(position: tuple) -> pygame.surface.Surface:
+    """Return the cached background tile of the cell at the position."""
+    cell = _background_cells.get(position)
+    if cell is None:
+        background = load_image(BACKGROUND_IMAGE, (SCREEN_WIDTH, GAME_HEIGHT))
+        cell = background.subsurface(
+            pygame.Rect(position, (GRID_SIZE, GRID_SIZE))
+        ).copy()
+        _background_cells[position] = cell
+    return cell
+
+
+# Fonts shared by all text objects: {(font_file, size): font}
+_fonts = {}
+# Rendered inscriptions, the least recently used are dropped first:
+# {(font_file, size, text, color, border_color): surface}
+_texts = OrderedDict()
+
+
+def get_font(font_file: str, size: int) -> pygame.font.Font:
+    """Return the font, it is opened only once."""
+    font = _fonts.get((font_file, size))
+    if font is None:
+        font = pygame.font.Font(f'{GRAPHICS_DIR}fonts/{font_file}', size)
+        _fonts[(font_file, size)] = font
+    return font
+
+
+def render_text(font_file: str, size: int, text: str, color,
+                border_color=None) -> pygame.surface.Surface:
+    """Render the text (with an outline if border color is given).
+
+    Rendered inscriptions are cached, so the same text is not
+    rendered twice while it is in use.
+    """
+    key = (font_file, size, text, color, border_color)
+    inscript = _texts.get(key)
+    if inscript is not None:
+        _texts.move_to_end(key)
+        return inscript
+    font = get_font(font_file, size)
+    if border_color is None:
+        inscript = font.render(text, True, color)
     else:
-        return GAME_SPACE
+        # Making the outline around the text:
+        outline = font.render(text, True, border_color)
+        inscript = pygame.Surface(
+            outline.get_rect().inflate(2 * BORDER_WIDTH,
+                                       2 * BORDER_WIDTH).size,
+            pygame.SRCALPHA
+        )
+        for offset in TEXT_OUTLINE_OFFSETS:
+            inscript.blit(outline, offset)
+        inscript.blit(font.render(text, True, color),
+                      (BORDER_WIDTH, BORDER_WIDTH))
+    _texts[key] = inscript
+    if len(_texts) > TEXT_CACHE_SIZE:
+        _texts.popitem(last=False)
+    return inscript
+
+
+def rotate_sprite(sprite_file: str) -> dict:
+    """Return dict with correctly rotated snake sprite for every direction."""
+    sprite_file = SNAKE_SPRITES_DIR + sprite_file
+    sprites = {
+        UP: load_image(sprite_file),
+        LEFT: load_image(
+            sprite_file, transform=(('rotate', 90), ('flip', False, True))
+        ),
+        RIGHT: load_image(sprite_file, transform=(('rotate', -90),)),
+        DOWN: load_image(sprite_file, transform=(('flip', False, True),))
+    }
+    return sprites
+
+
+def load_turning_sprites() -> dict:
+    """Return dict with snake body sprites for every turning."""
+    # Load an image and flip + rotate if needed
+    # !!! DO NOT CONFUSE THE DIRECTION IN THIS DICT
+    # AND THE ANGLE IN THE FILE NAME !!!
+    return {
+        (UP, RIGHT): load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNRIGHT),
+        (UP, LEFT): load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNLEFT),
+        (RIGHT, DOWN): load_image(
+            SNAKE_SPRITES_DIR + SNAKE_TURNING_UPRIGHT,
+            transform=(('flip', False, True), ('rotate', -90))
+        ),
+        (RIGHT, UP): load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_LEFTUP),
+        (DOWN, LEFT): load_image(
+            SNAKE_SPRITES_DIR + SNAKE_TURNING_LEFTUP,
+            transform=(('flip', True, False), ('rotate', 90))
+        ),
+        (DOWN, RIGHT): load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_UPRIGHT),
+        (LEFT, UP): load_image(
+            SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNLEFT,
+            transform=(('flip', False, True), ('rotate', -90))
+        ),
+        (LEFT, DOWN): load_image(
+            SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNRIGHT,
+            transform=(('flip', True, False), ('rotate', 90))
+        ),
+    }
+
+
+class SnakeAtlas:
+    """The class keeping every snake segment sprite in one surface.
 
+    Areas of sprites are looked up by heads[direction],
+    tails[direction] and bodies[direction_in][direction_out].
+    """
 
-def load_image(image_file: str,
-               size=(GRID_SIZE, GRID_SIZE)) -> pygame.surface.Surface:
-    """Load image and transform it, return pygame image surface."""
-    img = pygame.image.load(GRAPHICS_DIR + image_file)
-    return pygame.transform.scale(img, size)
+    __slots__ = ('surface', 'heads', 'tails', 'bodies')
+
+    def __init__(self, color=None):
+        """Bake all rotated and turning sprites into the atlas.
+
+        Sprites are tinted with the color if it is given.
+        """
+        sprites = {}
+        for kind, sprite_file in (('head', SNAKE_HEAD_SPRITE),
+                                  ('tail', SNAKE_TAIL_SPRITE)):
+            for direction, sprite in rotate_sprite(sprite_file).items():
+                sprites[(kind, direction)] = sprite
+        for direction, sprite in rotate_sprite(SNAKE_BODY_SPRITE).items():
+            sprites[(direction, direction)] = sprite
+        sprites.update(load_turning_sprites())
+        self.surface = pygame.Surface((GRID_SIZE * len(sprites), GRID_SIZE),
+                                      pygame.SRCALPHA)
+        self.heads = {}
+        self.tails = {}
+        self.bodies = {direction: {} for direction in (UP, RIGHT, DOWN, LEFT)}
+        for index, (key, sprite) in enumerate(sprites.items()):
+            # Copying pixels with their alpha instead of blending:
+            area = self.surface.blit(sprite, (index * GRID_SIZE, 0),
+                                     special_flags=pygame.BLEND_RGBA_MAX)
+            if key[0] == 'head':
+                self.heads[key[1]] = area
+            elif key[0] == 'tail':
+                self.tails[key[1]] = area
+            else:
+                self.bodies[key[0]][key[1]] = area
+        if color is not None:
+            # The sprites are green, so they are tinted in grayscale
+            # brightened twice:
+            self.surface = pygame.transform.grayscale(self.surface)
+            self.surface.blit(self.surface, (0, 0),
+                              special_flags=pygame.BLEND_RGB_ADD)
+            self.surface.fill(color, special_flags=pygame.BLEND_RGB_MULT)
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert_alpha()
+
+
+# Snake atlases shared by snakes of one color: {color: atlas}
+_snake_atlases = {}
+
+
+def get_snake_atlas(color=None) -> SnakeAtlas:
+    """Return the snake atlas of the color, it is built only once."""
+    atlas = _snake_atlases.get(color)
+    if atlas is None:
+        atlas = _snake_atlases[color] = SnakeAtlas(color)
+    return atlas
+
+
+def preload_assets():
+    """Load game sprites and fonts, so the game starts without delays.
+
+    It is a generator loading a slice of assets on every step,
+    so the menu stays responsive meanwhile.
+    """
+    for row in range(VIEW_HEIGHT):
+        for position in CELL_POSITIONS[row * VIEW_WIDTH:
+                                       (row + 1) * VIEW_WIDTH]:
+            get_background_cell(position)
+        yield True
+    load_image(APPLE_SPRITE)
+    yield True
+    get_snake_atlas()
+    yield True
+    get_font(MAIN_FONT, EVENT_TEXT_FONT_SIZE)
+    yield True
 
 
 def fill_background():
-    """Fill the game board with background image."""
-    screen.blit(load_image(BACKGROUND_IMAGE, (SCREEN_WIDTH, GAME_HEIGHT)),
-                (0, 0))
+    """Fill the game board in the window with background image."""
+    renderer.blit(load_image(BACKGROUND_IMAGE, (SCREEN_WIDTH, GAME_HEIGHT)),
+                  (0, 0))
+
+
+def fill_score_bar():
+    """Fill the whole score bar, parts not drawn by texts stay gray."""
+    renderer.draw_rect(SCORE_BACKGROUND_COLOR, SCORE_BAR_RECT)
 
 
 # Base classes:
 class GameObject:
     """The base class from which other game objects inherit."""
 
+    __slots__ = ('sprite', 'position')
+
     def __init__(self):
         """Initialize a game object."""
         self.sprite = None
@@ -135,47 +625,52 @@ class GameObject:
 
     def draw(self):
         """Draw an object."""
-        screen.blit(self.sprite, self.position)
+        renderer.blit(self.sprite, self.position)
 
     def _erase_sprite(self, position):
         """Erase the sprite and restore the background cell."""
-        background = load_image(BACKGROUND_IMAGE,
-                                (SCREEN_WIDTH, GAME_HEIGHT))
-        erasing_rect = pygame.Rect(position, (GRID_SIZE, GRID_SIZE))
-        background_cell = background.subsurface(erasing_rect)
-        screen.blit(background_cell, position)
+        renderer.blit(get_background_cell(position), position)
 
 
 class TextObject:
     """The base class from which other text objects inherit."""
 
+    __slots__ = ('font_file', 'font_size', 'text_color', 'text_position',
+                 'background_color', 'background_rect')
+
     def __init__(self):
         """Initialize a text object."""
-        self.font = None
+        self.font_file = None
+        self.font_size = None
         self.text_color = None
         self.text_position = None
         self.background_color = None
         self.background_rect = None
 
+    def _render(self) -> pygame.surface.Surface:
+        """Return the rendered text."""
+        return render_text(self.font_file, self.font_size, self.__str__(),
+                           self.text_color)
+
     def draw(self):
         """Draw the text."""
-        text_inscript = self.font.render(self.__str__(), True,
-                                         self.text_color)
+        text_inscript = self._render()
         if self.background_color:
-            pygame.draw.rect(screen, self.background_color,
-                             self.background_rect)
+            renderer.draw_rect(self.background_color, self.background_rect)
         text_rect = text_inscript.get_rect(center=self.text_position)
-        screen.blit(text_inscript, text_rect)
+        renderer.blit(text_inscript, text_rect)
 
 
 class EventText(TextObject):
     """The class template for text for game events like loss, victory etc."""
 
+    __slots__ = ('event', 'border_color')
+
     def __init__(self):
         """Initialize the event inscript."""
         super().__init__()
-        self.font = pygame.font.Font(f'{GRAPHICS_DIR}fonts/{MAIN_FONT}',
-                                     EVENT_TEXT_FONT_SIZE)
+        self.font_file = MAIN_FONT
+        self.font_size = EVENT_TEXT_FONT_SIZE
         self.text_position = CENTER_POSITION
         self.event = ''
         self.border_color = None
@@ -184,49 +679,106 @@ class EventText(TextObject):
         """Generate the event string."""
         return self.event
 
-    def _draw_outline(self, outline_position):
-        text_inscript = self.font.render(self.__str__(),
-                                         True, self.border_color)
-        text_rect = text_inscript.get_rect(center=outline_position)
-        screen.blit(text_inscript, text_rect)
-
-    def draw(self):
-        """Draw the event text."""
-        # Making the outline
-        for position in CENTER_TEXT_OUTLINE_POS:
-            self._draw_outline(position)
-        super().draw()
+    def _render(self) -> pygame.surface.Surface:
+        """Return the rendered text with the outline."""
+        return render_text(self.font_file, self.font_size, self.__str__(),
+                           self.text_color, self.border_color)
 
 
 # Game classes:
 class Apple(GameObject):
     """The class describing an apple and actions with it."""
 
+    __slots__ = ('state', 'camera')
+
     def __init__(self, snake):
         """Initialize an apple."""
         self.sprite = load_image(APPLE_SPRITE)
-        self.randomize_position(snake)
+        # The game state places the apple, the apple only shows it:
+        self.state = snake.state
+        self.camera = snake.camera
+
+    @property
+    def position(self):
+        """Return the apple position on the screen, None if it isn't shown."""
+        return self.camera.position(self.state.apple)
+
+    def draw(self):
+        """Draw the apple if it is in the window."""
+        position = self.position
+        if position is not None:
+            renderer.blit(self.sprite, position)
 
     def randomize_position(self, snake):
         """Set a random position of the apple on the playing field."""
         # Generating a new apple if there are free positions, else victory:
-        try:
-            self.position = choice(get_free_positions(snake.positions))
-        except IndexError:
-            snake.won = True
+        snake.state.place_apple()
+
+
+class Apples(GameObject):
+    """The class showing all apples of the arena."""
+
+    __slots__ = ('arena', 'camera')
+
+    def __init__(self, arena, camera: Camera):
+        """Initialize apples of the arena."""
+        self.sprite = load_image(APPLE_SPRITE)
+        self.arena = arena
+        self.camera = camera
+
+    def draw(self):
+        """Draw apples which are in the window."""
+        for cell in self.arena.apples:
+            position = self.camera.position(cell)
+            if position is not None:
+                renderer.blit(self.sprite, position)
+
+
+class AutopilotHint(GameObject):
+    """The frame around the cell the autopilot would go to."""
+
+    __slots__ = ('autopilot', 'state', 'camera', 'apple')
+
+    def __init__(self, autopilot: Autopilot, snake, apple: Apple):
+        """Initialize the hint for the snake."""
+        self.position = None
+        self.autopilot = autopilot
+        self.state = snake.state
+        self.camera = snake.camera
+        self.apple = apple
+
+    def draw(self):
+        """Move the frame to the next cell of the autopilot way."""
+        cell = self.autopilot.next_cell(self.state)
+        position = None if cell is None else self.camera.position(cell)
+        old_cell = (None if self.position is None
+                    else self.camera.cell(self.position))
+        # The snake may have crawled onto the old frame or the camera
+        # may have moved, then it is already gone:
+        if (position != self.position and old_cell is not None
+           and not self.state.is_occupied(old_cell)):
+            self._erase_sprite(self.position)
+            if old_cell == self.state.apple:
+                self.apple.draw()
+        self.position = position
+        if position is not None:
+            renderer.draw_rect(HINT_COLOR, (position, (GRID_SIZE, GRID_SIZE)),
+                               HINT_WIDTH)
 
 
 class DifficultyButtonInscript(TextObject):
     """The class for inscription on the difficulty buttton in the main menu."""
 
+    __slots__ = ('difficulty',)
+
     difficulties = tuple(DIFFICULTIES.keys())
 
     def __init__(self, difficulty):
         """Initialize the difficulty button inscription."""
         self.difficulty = difficulty
         super().__init__()
-        self.font = pygame.font.Font(f'{GRAPHICS_DIR}fonts/{MAIN_FONT}',
-                                     DIFFICULTY_SIZE)
+        self.font_file = MAIN_FONT
+        self.font_size = DIFFICULTY_SIZE
         self.text_color = DIFFICULTY_COLORS[difficulty]
         self.text_position = (
             GAME_HEIGHT // len(self.difficulties)
@@ -242,6 +794,8 @@ class DifficultyButtonInscript(TextObject):
 class GameOverInscript(EventText):
     """The class descibing the inscript, what apears when the game is over."""
 
+    __slots__ = ()
+
     def __init__(self):
         """Initialize the game over inscript."""
         super().__init__()
@@ -253,15 +807,19 @@ class GameOverInscript(EventText):
 class Score(TextObject):
     """The class describing the score."""
 
+    __slots__ = ('score', 'drawn_value')
+
     def __init__(self, snake_length):
         """Initialize the score."""
-        self.font = pygame.font.Font(f'{GRAPHICS_DIR}fonts/{SCORE_FONT}',
-                                     GRID_SIZE)
+        super().__init__()
+        self.font_file = SCORE_FONT
+        self.font_size = GRID_SIZE
         self.text_color = SCORE_COLOR
         self.text_position = SCORE_POSITION
         self.background_color = SCORE_BACKGROUND_COLOR
-        self.background_rect = pygame.Rect((0, GAME_HEIGHT),
-                                           (SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.background_rect = SCORE_RECT
+        # The value on the screen now, it is redrawn only if changed:
+        self.drawn_value = None
         self._update(snake_length)
 
     def __str__(self):
@@ -273,19 +831,24 @@ class Score(TextObject):
         self.score = snake_length - SNAKE_DEF_LENGTH
 
     def draw(self, snake_length):
-        """Draw the score."""
-        self._update(snake_length)
-        super().draw()
+        """Draw the score if it has changed."""
+        # Comparing values, so no text is made while nothing changes:
+        if snake_length != self.drawn_value:
+            self._update(snake_length)
+            super().draw()
+            self.drawn_value = snake_length
 
 
 class Hightscore(Score):
     """The class describing the hightscore."""
 
+    __slots__ = ('hightscore',)
+
     def __init__(self, hightscore):
         """Initialize the hightscore."""
         super().__init__(hightscore)
         self.text_position = HIGHTSCORE_POSITION
-        self.background_color = None
+        self.background_rect = HIGHTSCORE_RECT
 
     def __str__(self):
         """Generate the hightscore string."""
@@ -296,152 +859,263 @@ class Hightscore(Score):
         self.hightscore = hightscore
 
 
+class SnakePositions(Sequence):
+    """The read-only view of the snake segments positions on the screen.
+
+    Nothing is copied: indexing reads the snake body and the "in" check
+    looks at the board occupancy, so it takes O(1). Segments out
+    of the window have None positions.
+    """
+
+    __slots__ = ('state', 'camera')
+
+    def __init__(self, state: GameState, camera: Camera):
+        """Initialize the view over the game state."""
+        self.state = state
+        self.camera = camera
+
+    def __len__(self):
+        """Return the number of the snake segments."""
+        return len(self.state.body)
+
+    def __getitem__(self, index):
+        """Return position of the segment (or list for a slice)."""
+        body = self.state.body
+        if isinstance(index, slice):
+            return [self.camera.position(body[i])
+                    for i in range(*index.indices(len(body)))]
+        return self.camera.position(body[index])
+
+    def __iter__(self):
+        """Iterate over positions from the head to the tail."""
+        return map(self.camera.position, self.state.body)
+
+    def __contains__(self, position):
+        """Check if a snake segment lies on the position."""
+        cell = self.camera.cell(position)
+        return cell is not None and self.state.is_occupied(cell)
+
+
+class ProfileOverlay(TextObject):
+    """The class showing FPS, frame times and missed ticks."""
+
+    __slots__ = ('profiler', 'summary', 'updated_at')
+
+    def __init__(self, profiler: Profiler):
+        """Initialize the overlay."""
+        super().__init__()
+        self.profiler = profiler
+        self.font_file = SCORE_FONT
+        self.font_size = PROFILE_FONT_SIZE
+        self.text_color = SCORE_COLOR
+        self.text_position = PROFILE_RECT.center
+        self.background_color = SCORE_BACKGROUND_COLOR
+        self.background_rect = PROFILE_RECT
+        self.summary = profiler.summary()
+        self.updated_at = 0
+
+    def __str__(self):
+        """Generate the timings string."""
+        return ('{fps:.0f} FPS {p50:.1f}/{p99:.1f} ms '
+                'missed {missed}'.format(**self.summary))
+
+    def draw(self):
+        """Draw the timings from time to time."""
+        now = time.monotonic()
+        if now - self.updated_at >= PROFILE_OVERLAY_PERIOD:
+            self.summary = self.profiler.summary()
+            self.updated_at = now
+            super().draw()
+
+
 class Snake(GameObject):
-    """The class describing a snake and its behavior."""
+    """The class describing a snake and its behavior.
 
-    won = False
+    The snake is a view over the GameState which holds the snake body
+    and the game rules.
+    """
 
-    def __init__(self):
-        """Initialize a snake."""
+    __slots__ = ('state', 'camera', 'atlas', 'started_at', '_positions')
+
+    def __init__(self, state=None, color=None, camera=None):
+        """Initialize a snake, its sprites are tinted if color is given.
+
+        Snakes of one board share the camera, it is made if not given.
+        """
         super().__init__()
-        self.reset()
-        # Loading snake sprites and rotating them:
-        self.head_sprite = load_image(SNAKE_SPRITES_DIR + SNAKE_HEAD_SPRITE)
-        self.head_sprite_rotated = self._rotate_sprite(self.head_sprite)
-        self.body_sprite = load_image(SNAKE_SPRITES_DIR + SNAKE_BODY_SPRITE)
-        self.body_sprite_rotated = self._rotate_sprite(self.body_sprite)
-        self.tail_sprite = load_image(SNAKE_SPRITES_DIR + SNAKE_TAIL_SPRITE)
-        self.tail_sprite_rotated = self._rotate_sprite(self.tail_sprite)
-        # This dict contains correct body turning sprites for every turning
-        # (Load an image and flip + rotate if needed)
-        # !!! DO NOT CONFUSE THE DIRECTION IN THIS DICT
-        # AND THE ANGLE IN THE FILE NAME !!!
-        self.turning_bodies = {
-            (UP, RIGHT): load_image(SNAKE_SPRITES_DIR +
-                                    SNAKE_TURNING_DOWNRIGHT),
-            (UP, LEFT): load_image(SNAKE_SPRITES_DIR +
-                                   SNAKE_TURNING_DOWNLEFT),
-            (RIGHT, DOWN): pygame.transform.rotate(pygame.transform.flip(
-                load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_UPRIGHT),
-                False, True
-            ), -90),
-            (RIGHT, UP): load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_LEFTUP),
-            (DOWN, LEFT): pygame.transform.rotate(pygame.transform.flip(
-                load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_LEFTUP),
-                True, False
-            ), 90),
-            (DOWN, RIGHT): load_image(SNAKE_SPRITES_DIR +
-                                      SNAKE_TURNING_UPRIGHT),
-            (LEFT, UP): pygame.transform.rotate(pygame.transform.flip(
-                load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNLEFT),
-                False, True
-            ), -90),
-            (LEFT, DOWN): pygame.transform.rotate(pygame.transform.flip(
-                load_image(SNAKE_SPRITES_DIR + SNAKE_TURNING_DOWNRIGHT),
-                True, False
-            ), 90),
-        }
+        if state is None:
+            state = GameState(BOARD_WIDTH, BOARD_HEIGHT, seed=SEED)
+        self.state = state
+        if camera is None:
+            camera = Camera(state.width, state.height)
+        self.camera = camera
+        self.atlas = get_snake_atlas(color)
+        self._positions = SnakePositions(state, self.camera)
+        self._restart()
+
+    def _blit_segment(self, area: pygame.Rect, position):
+        """Draw the segment sprite with the area in the atlas."""
+        renderer.blit(self.atlas.surface, position, area)
 
     def draw(self):
         """Draw the snake."""
-        # Drawing body sprite instead of head and the tail:
-        if self.length > SNAKE_DEF_LENGTH:
-            # Drawing the neck:
-            self._erase_sprite(self.prev_head_pos)
-            if self.rotated:
-                screen.blit(self.turning_bodies[(self.directions_que[-1],
-                                                 self.direction)],
-                            self.prev_head_pos)
-            else:
-                screen.blit(self.body_sprite_rotated[self.direction],
-                            self.prev_head_pos)
-        # Deleting point from rotate history if snake body passed it:
-        if self.rotate_points and self.positions[-1] == self.rotate_points[0]:
-            del self.rotate_points[0]
-            del self.directions_que[0]
-        # Drawing the tail:
-        self._erase_sprite(self.positions[-1])
-        screen.blit(self.tail_sprite_rotated[
-            self.directions_que[0] if self.directions_que
-            else self.direction
-        ], self.positions[-1])
-        # Erasing the head cell in case apple has been eaten:
+        state = self.state
+        # Every segment keeps the direction it was entered with:
+        headings = state.headings
+        # The camera keeps the head of the followed snake far from
+        # the window edges, heads of other snakes may be out of it:
         head_position = self.get_head_position
-        self._erase_sprite(head_position)
-        # Drawing snake head
-        screen.blit(self.head_sprite_rotated[self.direction], head_position)
-        # Reseting the rotate flag:
-        self.rotated = False
+        # Drawing body sprite instead of head and the tail:
+        neck_position = self.prev_head_pos
+        if self.length > SNAKE_DEF_LENGTH and neck_position is not None:
+            # Drawing the neck, it is turning if the head has turned:
+            self._erase_sprite(neck_position)
+            self._blit_segment(self.atlas.bodies[headings[1]][headings[0]],
+                               neck_position)
+        # Drawing the tail, it points where the next segment was entered:
+        tail_position = self.get_tail_position
+        if tail_position is not None:
+            self._erase_sprite(tail_position)
+            self._blit_segment(self.atlas.tails[
+                headings[-2] if len(headings) > 1 else state.direction
+            ], tail_position)
+        if head_position is not None:
+            # Erasing the head cell in case apple has been eaten:
+            self._erase_sprite(head_position)
+            # Drawing snake head
+            self._blit_segment(self.atlas.heads[state.direction],
+                               head_position)
 
         # Erasing the last element
-        # Checking the coincidence of the head and tail is needed for cases
+        # Checking the cell is free is needed for cases
         # When the head crawls onto the cell where the tail just was.
         # In this case, without checking, the cell with its head is painted
         # Over and in the future remains a hole in the snake in this place
-        if self.last and self.last != head_position:
-            self._erase_sprite(self.last)
+        last = self.last
+        if last and not state.is_occupied(state.last):
+            self._erase_sprite(last)
+
+    def erase(self):
+        """Erase the snake which has left the board."""
+        state = self.state
+        for cell in (*state.body, state.last):
+            if cell is not None and not state.is_occupied(cell):
+                position = self.camera.position(cell)
+                if position is not None:
+                    self._erase_sprite(position)
+
+    def redraw(self):
+        """Draw the window again with the whole visible snake.
+
+        It is needed after the camera has moved.
+        """
+        fill_background()
+        self.draw_whole()
+
+    def draw_whole(self):
+        """Draw every segment of the snake which is in the window.
+
+        Only cells of the window are looked at, so it takes the same
+        time however long the snake is.
+        """
+        state = self.state
+        head = state.head
+        tail = state.tail
+        segment_headings = state.segment_headings
+        atlas = self.atlas
+        for cell, position in self.camera.visible_cells():
+            headings = segment_headings(cell)
+            if headings is None:
+                continue
+            heading_in, heading_out = headings
+            if cell == head:
+                self._blit_segment(atlas.heads[state.direction], position)
+            elif cell == tail:
+                # The tail points where the next segment was entered:
+                self._blit_segment(atlas.tails[heading_out], position)
+            else:
+                self._blit_segment(atlas.bodies[heading_in][heading_out],
+                                   position)
 
     @property
     def get_head_position(self) -> tuple:
         """Returns snake head position."""
-        return self.positions[0]
+        return self.camera.position(self.state.head)
+
+    @property
+    def get_tail_position(self):
+        """Returns snake tail position, None if it isn't in the window."""
+        return self.camera.position(self.state.tail)
+
+    @property
+    def positions(self) -> 'SnakePositions':
+        """Return positions of the snake segments, the head goes first."""
+        return self._positions
+
+    @property
+    def length(self) -> int:
+        """Return the snake length."""
+        return self.state.length
+
+    @property
+    def direction(self) -> tuple:
+        """Return the snake direction."""
+        return self.state.direction
+
+    @property
+    def next_direction(self) -> tuple:
+        """Return the direction the snake will have after queued turns."""
+        return self.state.next_direction
+
+    @property
+    def won(self) -> bool:
+        """Return True if there is no place for the apple left."""
+        return self.state.won
 
-    def move(self):
-        """Update the position of the snake.
+    @property
+    def prev_head_pos(self) -> tuple:
+        """Return the head position before the last move."""
+        return self.camera.position(self.state.prev_head)
+
+    @property
+    def last(self):
+        """Return position of the cell left by the tail, if it is seen."""
+        if self.state.last is None:
+            return None
+        return self.camera.position(self.state.last)
 
-        Add a new head to the beginning of the list
-        and remove the last element - the tail.
+    def move(self) -> int:
+        """Update the position of the snake, return the game events.
+
+        The game state adds a new head and removes the tail, checks
+        if the apple is eaten and if the snake has collided with itself.
         """
-        self.prev_head_pos = self.get_head_position
-        new_x_head_position = (self.prev_head_pos[0]
-                               + self.direction[0] * GRID_SIZE) % SCREEN_WIDTH
-        new_y_head_position = (self.prev_head_pos[1]
-                               + self.direction[1] * GRID_SIZE) % GAME_HEIGHT
-        self.positions.insert(0, (new_x_head_position, new_y_head_position))
-        # When the apple is eaten:
-        if self.length == len(self.positions):
-            self.last = None
-        # When the apple is not eaten:
-        else:
-            # Removing a segment from the snake
-            # And save the coordinates for shading in draw():
-            self.last = self.positions.pop()
-
-    def _rotate_sprite(self, sprite: pygame.surface.Surface) -> dict:
-        """Return dict with correctly rotated sprite for every direction."""
-        sprites = {
-            UP: sprite,
-            LEFT: pygame.transform.flip(
-                pygame.transform.rotate(sprite, 90), False, True
-            ),
-            RIGHT: pygame.transform.rotate(sprite, -90),
-            DOWN: pygame.transform.flip(sprite, False, True)
-        }
-        return sprites
-
-    def reset(self):
+        events = self.state.step()
+        if self.camera.follow(self.state.head):
+            self.redraw()
+        return events
+
+    def reset(self, seed=None):
         """Reset the snake to its initial state."""
-        self.won = False
-        # Erasing the snake:
+        self.state.reset(seed)
+        self._restart()
+
+    def _restart(self):
+        """Erase the snake, center the camera and start the game time."""
+        self.started_at = time.monotonic()
+        self.camera.center(self.state.head)
         fill_background()
-        # Reseting the snake:
-        self.length = SNAKE_DEF_LENGTH
-        self.positions = [self.position]
-        self.direction = RIGHT
-        self.rotated = False
-        # We will append direction change history here
-        # For correct tail rendering:
-        self.directions_que = []
-        self.rotate_points = []
 
     def update_direction(self, new_direction):
         """Update the direction after pressing the button."""
-        self.direction = new_direction
+        self.state.turn(new_direction)
 
 
 class VictoryInscript(EventText):
     """The class descibing the inscript, what apears when the game is won."""
 
+    __slots__ = ()
+
     def __init__(self):
         """Initialize the victory inscript."""
         super().__init__()
@@ -456,25 +1130,20 @@ def is_quited(event):
             or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE)
 
 
-def handle_keys(difficulty: str, game_object: Snake, results: dict):
+def handle_keys(difficulty: str, game_object: Snake, replay=None):
     """Process user actions."""
-    snake_length = game_object.length
     for event in pygame.event.get():
         if is_quited(event):
-            if snake_length > SNAKE_DEF_LENGTH:
-                save_results(f'{difficulty}.txt', snake_length, results)
-            pygame.quit()
-            raise SystemExit
+            if game_object.length > SNAKE_DEF_LENGTH:
+                save_results(difficulty, game_object)
+                save_replay(replay)
+            app.quit()
         elif event.type == pygame.KEYDOWN:
-            cur_key_direction = (event.key, game_object.direction)
+            # Quick presses are queued, one turn is made per tick,
+            # so the key is checked against the last queued direction:
+            cur_key_direction = (event.key, game_object.next_direction)
             if cur_key_direction in DIRECTION_KEYS:
-                game_object.rotated = True
-                game_object.directions_que.append(game_object.direction)
-                game_object.rotate_points.append(game_object.get_head_position)
                 game_object.update_direction(DIRECTION_KEYS[cur_key_direction])
-                # Preventing changing the direction more than 1 time
-                # Per iteration:
-                break
 
 
 def handle_main_menu() -> str:
@@ -487,13 +1156,15 @@ def handle_main_menu() -> str:
     )
     for difficulty in difficulties:
         difficulty.draw()
-    pygame.display.update()
-    # Checking difficulty choosing:
+    renderer.update()
+    app.report_startup()
+    # Checking difficulty choosing, assets are loaded meanwhile:
     while True:
+        clock.tick(DISPLAY_FPS)
+        app.load_assets_slice()
         for event in pygame.event.get():
             if is_quited(event):
-                pygame.quit()
-                raise SystemExit
+                app.quit()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if (CENTER_POSITION[1] - 100
                    < event.pos[1] < CENTER_POSITION[1] + 100):
@@ -505,8 +1176,8 @@ def handle_main_menu() -> str:
                     return choosed_difficulty
 
 
-def get_results(file_name: str) -> dict:
-    """Get result from specific files."""
+def read_text_results(file_name: str) -> dict:
+    """Get result from statistics files of the old versions."""
     with open(RESULTS_DIR + file_name, 'r', encoding="utf-8") as file:
         try:
             hightscore = int(file.readline().strip('\n'))
@@ -524,74 +1195,231 @@ def get_results(file_name: str) -> dict:
     return results
 
 
-def save_results(file_name: str, snake_length: int, results: dict):
-    """Save game results."""
-    if not DEBUG:
-        games_played = results['games_played'] + 1
-        results['averange_score'] = int(((results['averange_score'] *
-                                        results['games_played'] +
-                                        snake_length - SNAKE_DEF_LENGTH) /
-                                        games_played))
-        results['games_played'] = games_played
-        with open(RESULTS_DIR + file_name, 'w', encoding="utf-8") as file:
-            file.write(f'{results["hightscore"]}\n'
-                       f'{results["averange_score"]}\n{games_played}')
+def import_text_results(store: ResultsStore):
+    """Move statistics from the old text files to the store once."""
+    for difficulty in DIFFICULTIES:
+        file_name = f'{difficulty}.txt'
+        if os.path.exists(RESULTS_DIR + file_name):
+            store.import_results(difficulty,
+                                 **read_text_results(file_name))
+
+
+def get_results(difficulty: str) -> dict:
+    """Get results of the difficulty."""
+    return app.results.get_results(difficulty)
+
+
+def save_results(difficulty: str, snake: Snake):
+    """Save game results, they are written in the background."""
+    duration = time.monotonic() - snake.started_at
+    app.telemetry.end_session(difficulty, snake.state, duration)
+    if not (DEBUG or AUTOPILOT):
+        app.results.add_game(difficulty, snake.length - SNAKE_DEF_LENGTH,
+                             snake.state.ticks, duration)
+
+
+def save_replay(replay):
+    """Save the replay of the game."""
+    if not DEBUG and replay is not None:
+        replay.save()
+
+
+def play_replay(replay: Replay) -> GameState:
+    """Show the recorded game as fast as possible, return the final state."""
+    app.start()
+    app.wait_for_assets()
+    snake = Snake(replay.new_state())
+    apple = Apple(snake)
+    score = Score(SNAKE_DEF_LENGTH)
+    for action in replay.actions():
+        for event in pygame.event.get():
+            if is_quited(event):
+                app.quit()
+        if action is not None:
+            snake.update_direction(action)
+        events = snake.move()
+        apple.draw()
+        snake.draw()
+        score.draw(snake.length)
+        renderer.update()
+        if events & (DIED | WON):
+            break
+    return snake.state
+
+
+def redraw_arena(snakes: list, apples: Apples):
+    """Draw the window again with living snakes and apples."""
+    fill_background()
+    for snake in snakes:
+        if not snake.state.lost:
+            snake.draw_whole()
+    apples.draw()
+
+
+def play_arena(arena, policies: list, difficulty: str):
+    """Show the arena game until it is over.
+
+    Snakes with None policies are played with PLAYER_KEYS.
+    """
+    app.start()
+    app.wait_for_assets()
+    # All snakes and apples are seen through one camera:
+    camera = Camera(arena.width, arena.height)
+    snakes = [Snake(state, SNAKE_COLORS[index % len(SNAKE_COLORS)], camera)
+              for index, state in enumerate(arena.snakes)]
+    apples = Apples(arena, camera)
+    score = Score(SNAKE_DEF_LENGTH)
+    players = [state for state, policy in zip(arena.snakes, policies)
+               if policy is None]
+    # The camera follows the first player or the first living snake:
+    followed = snakes[0]
+    camera.center(followed.state.head)
+    redraw_arena(snakes, apples)
+    tick_time = 1 / DIFFICULTIES[difficulty]
+    accumulator = 0.0
+    previous = time.perf_counter()
+    while not arena.done:
+        clock.tick(DISPLAY_FPS)
+        now = time.perf_counter()
+        accumulator += min(now - previous, MAX_FRAME_TIME)
+        previous = now
+        for event in pygame.event.get():
+            if is_quited(event):
+                app.quit()
+            elif event.type == pygame.KEYDOWN:
+                for player, keys in zip(players, PLAYER_KEYS):
+                    if event.key in keys:
+                        player.turn(keys[event.key])
+        while accumulator >= tick_time and not arena.done:
+            accumulator -= tick_time
+            events = arena.step([
+                policy(state) if policy and not state.lost else None
+                for state, policy in zip(arena.snakes, policies)
+            ])
+            if followed.state.lost:
+                followed = next((snake for snake in snakes
+                                 if not snake.state.lost), followed)
+            if camera.follow(followed.state.head):
+                redraw_arena(snakes, apples)
+                continue
+            # Dead snakes are erased before others are drawn:
+            for snake, snake_events in zip(snakes, events):
+                if snake_events & DIED:
+                    snake.erase()
+            for snake in snakes:
+                if not snake.state.lost:
+                    snake.draw()
+            # Apples may be put on cells erased by snakes,
+            # they are never under snakes, so they are drawn last:
+            apples.draw()
+        score.draw(max(state.length for state in arena.snakes))
+        renderer.update()
+    game_over_inscript = GameOverInscript()
+    game_over_inscript.draw()
+    renderer.update()
+    clock.tick(0.5)
 
 
 def win():
     """Generate and draw victory inscript."""
     victory = VictoryInscript()
     victory.draw()
-    pygame.display.update()
+    renderer.update()
     clock.tick(0.1)
 
 
 def main():
     """Maintain the game."""
-    # Initialising pygame and the objects:
-    pygame.init()
-    snake = Snake()
-    apple = Apple(snake)
-    score = Score(snake.length)
-    # The backround is filled during snake.reset() in snake.__init__().
-    # Now drawing the lower row for score
+    # Opening the window, assets are loaded while the menu is shown:
+    app.start()
+    score = Score(SNAKE_DEF_LENGTH)
+    # Drawing the lower row for score
     # So it won't be empty during difficulty choosing:
-    score.draw(snake.length)
+    score.draw(SNAKE_DEF_LENGTH)
     # Starting main menu to choose difficulty:
     difficulty = handle_main_menu()
+    # Initialising the objects:
+    app.wait_for_assets()
+    snake = Snake()
+    apple = Apple(snake)
+    replay = Replay.start_recording(snake.state, difficulty)
+    autopilot = Autopilot(snake.state.width, snake.state.height)
+    hint = AutopilotHint(autopilot, snake, apple) if AUTOPILOT_HINT else None
     # Getting statistics:
-    results = get_results(f'{difficulty}.txt')
+    results = get_results(difficulty)
     hightscore = Hightscore(results['hightscore'])
+    profiler = app.start_profiling(DIFFICULTIES[difficulty])
+    profiler.wrap(snake.state, 'place_apple', 'apple')
+    telemetry = app.start_telemetry()
+    overlay = ProfileOverlay(profiler) if PROFILE else None
+    tick_time = 1 / DIFFICULTIES[difficulty]
+    # Time not played as game ticks yet:
+    accumulator = 0.0
+    previous = time.perf_counter()
 
     # Starting the game:
     while True:
-        clock.tick(DIFFICULTIES[difficulty])
-        handle_keys(difficulty, snake, results)
-        snake.move()
-        # Checking if snake ate the apple:
-        if snake.get_head_position == apple.position:
-            snake.length += 1
-            if snake.length > results['hightscore'] + SNAKE_DEF_LENGTH:
-                results['hightscore'] = snake.length - SNAKE_DEF_LENGTH
-            apple.randomize_position(snake)
-            if snake.won:
-                win()
-                save_results(f'{difficulty}.txt', snake.length, results)
+        clock.tick(DISPLAY_FPS)
+        profiler.start_frame()
+        now = time.perf_counter()
+        frame_time = now - previous
+        accumulator += min(frame_time, MAX_FRAME_TIME)
+        previous = now
+        # Ticks cut with the long frame are missed as well:
+        profiler.count_missed(accumulator
+                              + max(frame_time - MAX_FRAME_TIME, 0))
+        handle_keys(difficulty, snake, replay)
+        profiler.lap('input')
+        # Playing the ticks due by now, queued turns are made one per tick:
+        while accumulator >= tick_time:
+            accumulator -= tick_time
+            if AUTOPILOT:
+                direction = autopilot(snake.state)
+                if direction is not None:
+                    snake.update_direction(direction)
+            events = snake.move()
+            replay.record(snake.state)
+            telemetry.tick(snake.state, events)
+            profiler.lap('move')
+            # Checking if snake ate the apple:
+            if events & ATE:
+                if snake.length > results['hightscore'] + SNAKE_DEF_LENGTH:
+                    results['hightscore'] = snake.length - SNAKE_DEF_LENGTH
+                if events & WON:
+                    win()
+                    save_results(difficulty, snake)
+                    save_replay(replay)
+                    snake.reset()
+                    autopilot.reset()
+                    replay = Replay.start_recording(snake.state, difficulty)
+            # Checking if the snake has collided with itself:
+            elif events & DIED:
+                save_results(difficulty, snake)
+                save_replay(replay)
+                game_over_inscript = GameOverInscript()
+                game_over_inscript.draw()
+                renderer.update()
+                clock.tick(0.5)
                 snake.reset()
-                apple.randomize_position(snake)
-        # Checking if the snake has collided with itself:
-        elif snake.get_head_position in snake.positions[2:]:
-            save_results(f'{difficulty}.txt', snake.length, results)
-            game_over_inscript = GameOverInscript()
-            game_over_inscript.draw()
-            pygame.display.update()
-            clock.tick(0.5)
-            snake.reset()
-        apple.draw()
-        snake.draw()
+                autopilot.reset()
+                replay = Replay.start_recording(snake.state, difficulty)
+            if events & (DIED | WON):
+                # The pause after the game is not played as ticks:
+                accumulator = 0.0
+                previous = time.perf_counter()
+            profiler.lap('events')
+            apple.draw()
+            snake.draw()
+            if hint:
+                hint.draw()
+            profiler.lap('snake_draw')
         score.draw(snake.length)
         hightscore.draw(results['hightscore'])
-        pygame.display.update()
+        if overlay:
+            overlay.draw()
+        profiler.lap('text_draw')
+        renderer.update()
+        profiler.lap('display_update')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+"""Bot tournament: many automated Snake games on all CPU cores.
+
+    python tournament.py --games 100 --policies greedy hamiltonian
+
+Every game is added to the bot results store with the policy name
+as the player. The difficulty only sets the game speed, bots play
+as fast as they can, so their games are stored under BOT_DIFFICULTY.
+Use --board to stress bots on big boards.
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import mean, median
+
+from bots import POLICIES, play
+from game_state import GameState
+from results_store import ResultsStore
+from the_snake import BOARD_HEIGHT, BOARD_WIDTH, RESULTS_DIR
+
+BOT_RESULTS_FILE = f'{RESULTS_DIR}bots.sqlite3'
+# The difficulty of games played without the tick timer:
+BOT_DIFFICULTY = 'headless'
+# Games played by one worker task:
+GAMES_PER_TASK = 10
+# Games longer than this are stopped:
+MAX_TICKS = 1_000_000
+
+
+def play_games(policy_name: str, games: int, seed: int, results_file: str,
+               board=(BOARD_WIDTH, BOARD_HEIGHT)) -> tuple:
+    """Play the games and save results.
+
+    Return [(score, won, ticks)] and the time spent on playing.
+    """
+    started_at = time.perf_counter()
+    policy = POLICIES[policy_name](*board, seed)
+    state = GameState(*board, seed=seed)
+    games_results = []
+    store_games = []
+    for _ in range(games):
+        game_started_at = time.perf_counter()
+        play(policy, state, MAX_TICKS)
+        games_results.append((state.score, state.won, state.ticks))
+        store_games.append((BOT_DIFFICULTY, policy_name, state.score,
+                            state.ticks,
+                            time.perf_counter() - game_started_at))
+        state.reset()
+        policy.reset()
+    elapsed = time.perf_counter() - started_at
+    # SQLite makes workers wait for each other, so no game is lost:
+    store = ResultsStore(results_file)
+    store.write_games(store_games)
+    store.close()
+    return games_results, elapsed
+
+
+def print_statistics(policy_name: str, games_results: list, elapsed: float):
+    """Print the statistics of the bot, elapsed is its playing time."""
+    scores = [score for score, _, _ in games_results]
+    win_ticks = [ticks for _, won, ticks in games_results if won]
+    total_ticks = sum(ticks for _, _, ticks in games_results)
+    print(f'{policy_name:<12} games {len(scores)}, '
+          f'score mean {mean(scores):.1f} median {median(scores)} '
+          f'max {max(scores)}, '
+          f'wins {len(win_ticks) / len(scores):.0%}, '
+          f'ticks to win {mean(win_ticks) if win_ticks else 0:.0f}, '
+          f'{total_ticks / elapsed:.0f} steps/s per core')
+    histogram = Counter(score // 10 * 10 for score in scores)
+    for low in sorted(histogram):
+        print(f'{"":>13}{low:>4}-{low + 9:<4} {histogram[low]}')
+
+
+def main():
+    """Run the tournament."""
+    parser = argparse.ArgumentParser(description='Snake bot tournament.')
+    parser.add_argument('--games', type=int, default=100,
+                        help='games for every bot')
+    parser.add_argument('--policies', nargs='+', choices=POLICIES,
+                        default=list(POLICIES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results-file', default=BOT_RESULTS_FILE)
+    parser.add_argument('--board', type=int, nargs=2,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        default=(BOARD_WIDTH, BOARD_HEIGHT),
+                        help='board size in cells')
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    games_results = {}
+    playing_time = Counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        tasks = {}
+        seed = args.seed
+        for policy_name in args.policies:
+            games_results[policy_name] = []
+            for first in range(0, args.games, GAMES_PER_TASK):
+                games = min(GAMES_PER_TASK, args.games - first)
+                task = executor.submit(play_games, policy_name, games, seed,
+                                       args.results_file, tuple(args.board))
+                tasks[task] = policy_name
+                seed += 1
+        for task in as_completed(tasks):
+            results, elapsed = task.result()
+            games_results[tasks[task]].extend(results)
+            playing_time[tasks[task]] += elapsed
+    elapsed = time.perf_counter() - started_at
+
+    for policy_name, results in games_results.items():
+        print_statistics(policy_name, results, playing_time[policy_name])
+    total_ticks = sum(ticks for results in games_results.values()
+                      for _, _, ticks in results)
+    print(f'{sum(map(len, games_results.values()))} games '
+          f'in {elapsed:.1f} s, {total_ticks / elapsed:.0f} steps/s')
+
+
+if __name__ == '__main__':
+    main()
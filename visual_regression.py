@@ -0,0 +1,248 @@
+"""Visual regression checks of the game rendering.
+
+    python visual_regression.py --save   # remember frames as golden
+    python visual_regression.py          # compare frames with golden ones
+
+Every session is a game played by a bot with a fixed seed and drawn
+offscreen as in the window. Only changed areas are copied to the frame
+as they are pushed to the display, so a missed area shows up too.
+Frames at chosen ticks are hashed and compared with golden hashes
+(results/golden/hashes.json), sessions are played by worker processes
+at once. A changed frame is saved with the image of changed pixels
+(red) next to it, the exit code is 1 then. Golden frames depend on
+the pygame version, so they are saved again after updating it.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+
+import the_snake  # noqa: E402
+from autopilot import Autopilot  # noqa: E402
+from bots import POLICIES  # noqa: E402
+from export import policy_actions, render_game, write_png  # noqa: E402
+from game_state import DIED, WON, GameState  # noqa: E402
+
+GOLDEN_DIR = f'{the_snake.RESULTS_DIR}golden/'
+DIFF_DIR = f'{the_snake.RESULTS_DIR}visual_diff/'
+HASHES_FILE = 'hashes.json'
+# Unchanged pixels of diff images are dimmed by this factor:
+DIFF_DIMMING = 0.3
+DIFF_COLOR = (255, 0, 0)
+
+# Sessions: {name: function yielding (frame label, surface)}
+SESSIONS = {}
+
+
+def session(name: str):
+    """Register the session function."""
+    def register(play):
+        SESSIONS[name] = play
+        return play
+    return register
+
+
+def _bot_game(policy_name: str, board: tuple, seed: int, ticks: int,
+              every: int):
+    """Yield frames of the bot game every few ticks and the last one."""
+    state = GameState(*board, seed=seed)
+    policy = POLICIES[policy_name](*board, seed)
+    actions = policy_actions(policy, state, ticks)
+    for tick, _ in render_game(state, actions, every):
+        yield f'tick{tick:05d}', the_snake.renderer.presented
+
+
+def _banner(inscript: the_snake.EventText):
+    """Draw the banner shown at the end of the game, return the frame."""
+    inscript.draw()
+    the_snake.renderer.update()
+    return the_snake.renderer.presented
+
+
+@session('greedy')
+def greedy():
+    """Play the greedy bot until it dies and show "Game Over"."""
+    yield from _bot_game('greedy', (the_snake.BOARD_WIDTH,
+                                    the_snake.BOARD_HEIGHT), 1, 2000, 100)
+    yield 'game_over', _banner(the_snake.GameOverInscript())
+
+
+@session('victory')
+def victory():
+    """Win on the small board and show "You won!"."""
+    yield from _bot_game('hamiltonian', (4, 4), 2, 1000, 10)
+    yield 'victory', _banner(the_snake.VictoryInscript())
+
+
+@session('big_board')
+def big_board():
+    """Play on the board bigger than the window, the camera moves."""
+    yield from _bot_game('autopilot', (150, 120), 3, 900, 150)
+
+
+@session('autopilot_hint')
+def autopilot_hint():
+    """Play the random bot with the hint of the autopilot shown."""
+    board = (the_snake.BOARD_WIDTH, the_snake.BOARD_HEIGHT)
+    state = GameState(*board, seed=4)
+    snake = the_snake.Snake(state)
+    apple = the_snake.Apple(snake)
+    hint = the_snake.AutopilotHint(Autopilot(*board), snake, apple)
+    policy = POLICIES['random'](*board, 4)
+    for _ in range(600):
+        direction = policy(state)
+        if direction is not None:
+            snake.update_direction(direction)
+        events = snake.move()
+        apple.draw()
+        snake.draw()
+        hint.draw()
+        the_snake.renderer.update()
+        if events & (DIED | WON) or state.ticks % 100 == 0:
+            yield f'tick{state.ticks:05d}', the_snake.renderer.presented
+        if events & (DIED | WON):
+            break
+
+
+def _start_worker():
+    """Open the offscreen window and the frame presented in it."""
+    the_snake.app.open_window()
+    the_snake.renderer.presented = the_snake.renderer.surface.copy()
+
+
+def _save_frame(file_name: str, pixels: np.ndarray):
+    """Write RGB pixels (width x height x 3) to the PNG file."""
+    width, height, _ = pixels.shape
+    rgbx = np.zeros((height, width, 4), dtype=np.uint8)
+    rgbx[:, :, :3] = pixels.transpose(1, 0, 2)
+    write_png(file_name, rgbx, (0, 1, 2))
+
+
+def _save_diff(file_name: str, pixels: np.ndarray, golden: np.ndarray) -> int:
+    """Write the dimmed frame with changed pixels marked, return them."""
+    changed = (pixels != golden).any(axis=2)
+    diff = (pixels * DIFF_DIMMING).astype(np.uint8)
+    diff[changed] = DIFF_COLOR
+    _save_frame(file_name, diff)
+    return int(changed.sum())
+
+
+def check_session(name: str, golden: dict, golden_dir: str, diff_dir: str,
+                  save: bool) -> tuple:
+    """Play the session, compare its frames with golden hashes.
+
+    Golden frames are saved instead if save is True. Return
+    (name, {label: hash}, [(label, changed pixels or None)]).
+    """
+    # The screen is cleaned, so sessions don't depend on each other:
+    the_snake.renderer.surface.fill((0, 0, 0))
+    the_snake.renderer.presented.fill((0, 0, 0))
+    the_snake.renderer.dirty_rects.clear()
+    hashes = {}
+    mismatches = []
+    for label, surface in SESSIONS[name]():
+        pixels = pygame.surfarray.array3d(surface)
+        digest = hashlib.sha1(np.ascontiguousarray(pixels)).hexdigest()
+        hashes[label] = digest
+        frame_name = f'{name}-{label}.png'
+        if save:
+            _save_frame(golden_dir + frame_name, pixels)
+            continue
+        if golden.get(label) == digest:
+            continue
+        os.makedirs(diff_dir, exist_ok=True)
+        _save_frame(diff_dir + frame_name, pixels)
+        changed = None
+        if os.path.exists(golden_dir + frame_name):
+            golden_pixels = pygame.surfarray.array3d(
+                pygame.image.load(golden_dir + frame_name)
+            )
+            if golden_pixels.shape == pixels.shape:
+                changed = _save_diff(
+                    f'{diff_dir}{name}-{label}-diff.png', pixels,
+                    golden_pixels
+                )
+        mismatches.append((label, changed))
+    return name, hashes, mismatches
+
+
+def main():
+    """Compare frames of sessions with golden ones or save them."""
+    parser = argparse.ArgumentParser(description='Snake visual regression.')
+    parser.add_argument('names', nargs='*',
+                        help='sessions to check (all by default)')
+    parser.add_argument('--save', action='store_true',
+                        help='save frames as golden ones')
+    parser.add_argument('--golden', default=GOLDEN_DIR,
+                        help='the directory of golden frames')
+    parser.add_argument('--diff', default=DIFF_DIR,
+                        help='the directory of changed frames')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    unknown = set(args.names) - set(SESSIONS)
+    if unknown:
+        parser.error(f'Unknown sessions: {", ".join(sorted(unknown))}')
+    golden_dir = os.path.join(args.golden, '')
+    diff_dir = os.path.join(args.diff, '')
+    names = args.names or list(SESSIONS)
+
+    hashes_file = golden_dir + HASHES_FILE
+    golden = {'pygame': pygame.version.ver, 'sessions': {}}
+    if os.path.exists(hashes_file):
+        with open(hashes_file, encoding='utf-8') as file:
+            golden = json.load(file)
+    elif not args.save:
+        parser.error(f'No golden frames in {golden_dir}, save them first '
+                     'with --save')
+    if golden['pygame'] != pygame.version.ver and not args.save:
+        print(f'Golden frames are made with pygame {golden["pygame"]}, '
+              f'frames may differ with {pygame.version.ver}')
+    if args.save:
+        os.makedirs(golden_dir, exist_ok=True)
+        golden['pygame'] = pygame.version.ver
+
+    started_at = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(args.workers,
+                             initializer=_start_worker) as executor:
+        tasks = [executor.submit(check_session, name,
+                                 golden['sessions'].get(name, {}),
+                                 golden_dir, diff_dir, args.save)
+                 for name in names]
+        for task in tasks:
+            name, hashes, mismatches = task.result()
+            if args.save:
+                golden['sessions'][name] = hashes
+                print(f'{name:<16} {len(hashes)} frames saved')
+                continue
+            print(f'{name:<16} {len(hashes) - len(mismatches)} '
+                  f'of {len(hashes)} frames match')
+            for label, changed in mismatches:
+                failed.append(f'{name}-{label}')
+                print(f'{"":<16} {label}: '
+                      + ('no golden frame' if changed is None
+                         else f'{changed} pixels changed'))
+    elapsed = time.perf_counter() - started_at
+
+    if args.save:
+        with open(hashes_file, 'w', encoding='utf-8') as file:
+            json.dump(golden, file, indent=1)
+        print(f'Golden frames saved to {golden_dir} in {elapsed:.1f} s')
+    elif failed:
+        print(f'Changed frames are saved to {diff_dir} '
+              f'({elapsed:.1f} s)')
+        sys.exit(1)
+    else:
+        print(f'All frames match ({elapsed:.1f} s)')
+
+
+if __name__ == '__main__':
+    main()